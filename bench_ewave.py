@@ -0,0 +1,304 @@
+# -*- mode: python -*-
+"""
+Benchmarks for ewave.
+
+Synthetic files are generated in a temporary directory for every supported
+storage format, number of channels, and size, and the following are timed:
+
+open:           opening and closing a file (reported as files per second)
+read_memmap:    read(memmap='r') and touching all the data
+read_nomemmap:  read(memmap=False) and touching all the data
+random_reads:   reads of 256 frames at random offsets (time per read)
+scan:           iter_blocks() through the whole file
+write_SRC:      write() from data of type SRC, rescaled to the file's format.
+                Every type that can be stored is used as a source for every
+                format.
+
+Reads are from the page cache, because each benchmark is repeated. The best
+time of several runs is reported, along with the peak memory allocated
+during one run (as seen by tracemalloc, so memory-mapped data aren't
+included). The peak resident set size is also reported, but only once for
+the whole process after all the benchmarks have run, so it's the high-water
+mark of the largest benchmark rather than a per-benchmark figure. Use --only
+to run a single benchmark if its RSS is needed.
+
+Results can be saved with --save and compared to a saved baseline with
+--compare, which exits with a nonzero status if any benchmark got slower by
+more than --tolerance.
+
+    python bench_ewave.py --sizes 1K,1M,64M --save baseline.json
+    python bench_ewave.py --sizes 1K,1M,64M --compare baseline.json
+
+Copyright (C) 2012-2023 Dan Meliza <dan // AT // meliza.org>
+"""
+
+import argparse
+import json
+import os
+import re
+import sys
+import tempfile
+import timeit
+import tracemalloc
+from pathlib import Path
+
+import numpy as np
+
+import ewave
+
+# storage formats, as (dtype, sampwidth)
+FORMATS = {
+    "u1": ("B", None),
+    "i2": ("h", None),
+    "i3": ("i", 3),
+    "i4": ("i", None),
+    "i8": ("l", None),
+    "f4": ("f", None),
+    "f8": ("d", None),
+}
+CHANNELS = (1, 2, 8)
+# types of the data passed to write()
+SOURCES = tuple(dict.fromkeys(dtype for dtype, _ in FORMATS.values()))
+
+# number of frames in each read by random_reads, and the number of reads
+RANDOM_FRAMES = 256
+RANDOM_READS = 100
+
+# largest block of source data kept in memory by the write benchmarks
+_WRITE_BLOCK = 1 << 24
+
+
+def parse_size(text: str) -> int:
+    """Parses a size in bytes with an optional K, M, or G suffix"""
+    units = {"": 1, "K": 1 << 10, "M": 1 << 20, "G": 1 << 30}
+    match = re.fullmatch(r"(\d+)([KMG]?)B?", text.strip().upper())
+    if match is None:
+        raise ValueError(f"invalid size: {text}")
+    return int(match.group(1)) * units[match.group(2)]
+
+
+def format_size(nbytes: int) -> str:
+    for unit, scale in (("G", 1 << 30), ("M", 1 << 20), ("K", 1 << 10)):
+        if nbytes >= scale and nbytes % scale == 0:
+            return f"{nbytes // scale}{unit}"
+    return str(nbytes)
+
+
+def noise(nframes: int, nchannels: int, dtype: str, seed: int = 0) -> np.ndarray:
+    """Returns uniform noise in the range of dtype"""
+    rng = np.random.default_rng(seed)
+    data = rng.uniform(-0.9, 0.9, size=(nframes, nchannels)).astype("f")
+    return ewave.rescale(data, dtype)
+
+
+def make_file(path: Path, fmt: str, nchannels: int, nbytes: int) -> int:
+    """Writes a file with about nbytes of noise. Returns the number of frames."""
+    dtype, sampwidth = FORMATS[fmt]
+    framesize = nchannels * (sampwidth or np.dtype(dtype).itemsize)
+    nframes = max(1, nbytes // framesize)
+    rows = max(1, _WRITE_BLOCK // (nchannels * 4))
+    block = noise(min(rows, nframes), nchannels, "f")
+    with ewave.open(
+        path, "w", dtype=dtype, sampwidth=sampwidth, nchannels=nchannels
+    ) as fp:
+        for i in range(0, nframes, rows):
+            fp.write(block[: min(rows, nframes - i)])
+    return nframes
+
+
+def measure(func, repeat: int, min_time: float = 0.2) -> tuple[float, int]:
+    """Returns the best time for one call to func and the peak memory it
+    allocates. Each run calls func enough times to take at least min_time."""
+    timer = timeit.Timer(func)
+    number = max(1, round(min_time / max(timer.timeit(1), 1e-9)))
+    best = min(timer.repeat(repeat, number)) / number
+    tracemalloc.start()
+    try:
+        func()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return best, peak
+
+
+def benchmarks(path: Path, out: Path, fmt: str, nframes: int, nchannels: int):
+    """Yields (name, function, bytes processed) for a file"""
+    dtype, sampwidth = FORMATS[fmt]
+    nbytes = path.stat().st_size
+
+    def open_file():
+        ewave.open(path).__del__()
+
+    yield "open", open_file, 0
+
+    def read(memmap):
+        def run():
+            with ewave.open(path) as fp:
+                fp.read(memmap=memmap).max()
+
+        return run
+
+    yield "read_memmap", read("r"), nbytes
+    yield "read_nomemmap", read(False), nbytes
+
+    frames = min(RANDOM_FRAMES, nframes)
+    rng = np.random.default_rng(1)
+    offsets = rng.integers(0, nframes - frames + 1, size=RANDOM_READS).tolist()
+    fp = ewave.open(path)
+
+    def random_reads():
+        for offset in offsets:
+            np.array(fp.read(frames, offset, memmap="r"))
+
+    framesize = nchannels * (sampwidth or np.dtype(dtype).itemsize)
+    yield "random_reads", random_reads, frames * framesize * len(offsets)
+
+    def scan():
+        with ewave.open(path) as fp:
+            for block in fp.iter_blocks(65536):
+                block.max()
+
+    yield "scan", scan, nbytes
+
+    rows = max(1, min(nframes, _WRITE_BLOCK // (nchannels * 8)))
+    for src in SOURCES:
+        block = noise(rows, nchannels, src)
+
+        def write(block=block):
+            with ewave.open(
+                out, "w", dtype=dtype, sampwidth=sampwidth, nchannels=nchannels
+            ) as wfp:
+                for i in range(0, nframes, rows):
+                    wfp.write(block[: min(rows, nframes - i)])
+
+        yield f"write_{src}", write, nbytes
+    fp.__del__()
+
+
+def run(args) -> dict:
+    """Runs the benchmarks selected by args and returns the results"""
+    results = {}
+    only = re.compile(args.only) if args.only else None
+    with tempfile.TemporaryDirectory(dir=args.dir) as tmpdir:
+        tmpdir = Path(tmpdir)
+        for size in args.sizes:
+            for fmt in args.formats:
+                for nchannels in args.channels:
+                    path = tmpdir / f"{fmt}x{nchannels}_{format_size(size)}.wav"
+                    nframes = make_file(path, fmt, nchannels, size)
+                    label = f"{fmt}x{nchannels},{format_size(size)}"
+                    for op, func, nbytes in benchmarks(
+                        path, tmpdir / "out.wav", fmt, nframes, nchannels
+                    ):
+                        name = f"{op}[{label}]"
+                        if only is not None and not only.search(name):
+                            continue
+                        seconds, peak = measure(func, args.repeat, args.min_time)
+                        results[name] = {
+                            "seconds": seconds,
+                            "bytes": nbytes,
+                            "peak_alloc": peak,
+                        }
+                        report(name, results[name])
+                    path.unlink()
+    return results
+
+
+def report(name: str, result: dict):
+    seconds = result["seconds"]
+    if result["bytes"]:
+        rate = f"{result['bytes'] / seconds / 1e6:10.1f} MB/s"
+    else:
+        rate = f"{1 / seconds:10.0f} /s   "
+    print(
+        f"{name:36s} {seconds * 1e3:10.3f} ms {rate} "
+        f"{result['peak_alloc'] / 1e6:8.2f} MB alloc",
+        flush=True,
+    )
+
+
+def compare(results: dict, baseline: dict, tolerance: float) -> list[str]:
+    """Returns the names of benchmarks that are slower than in baseline"""
+    slower = []
+    for name, result in results.items():
+        if name not in baseline:
+            continue
+        ratio = result["seconds"] / baseline[name]["seconds"]
+        if ratio > 1 + tolerance:
+            slower.append(name)
+            print(f"REGRESSION {name}: {ratio:.2f}x slower than baseline")
+    return slower
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description="Benchmark ewave")
+    parser.add_argument(
+        "--sizes",
+        type=lambda s: [parse_size(x) for x in s.split(",")],
+        default="1K,1M,64M",
+        help="comma-separated sizes of the test files (e.g. 1K,1M,4G)",
+    )
+    parser.add_argument(
+        "--formats",
+        type=lambda s: s.split(","),
+        default=list(FORMATS),
+        help=f"comma-separated storage formats ({','.join(FORMATS)})",
+    )
+    parser.add_argument(
+        "--channels",
+        type=lambda s: [int(x) for x in s.split(",")],
+        default=list(CHANNELS),
+        help="comma-separated numbers of channels",
+    )
+    parser.add_argument("--only", help="only run benchmarks matching this regex")
+    parser.add_argument("--repeat", type=int, default=5, help="number of runs")
+    parser.add_argument(
+        "--min-time", type=float, default=0.2, help="minimum duration of a run (s)"
+    )
+    parser.add_argument("--dir", help="where to put the test files")
+    parser.add_argument("--save", help="save the results to this JSON file")
+    parser.add_argument("--compare", help="compare to results saved with --save")
+    parser.add_argument(
+        "--tolerance",
+        type=float,
+        default=0.25,
+        help="fraction by which a benchmark can be slower than the baseline",
+    )
+    args = parser.parse_args(argv)
+    for fmt in args.formats:
+        if fmt not in FORMATS:
+            parser.error(f"unknown format {fmt}")
+
+    results = run(args)
+    info = {
+        "ewave": ewave.__version__,
+        "numpy": np.__version__,
+        "python": sys.version.split()[0],
+        "platform": sys.platform,
+        "cpus": os.cpu_count(),
+    }
+    try:
+        import resource
+
+        # kilobytes on Linux, bytes on macOS
+        scale = 1 if sys.platform == "darwin" else 1024
+        info["max_rss"] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * scale
+        print(f"peak RSS of all benchmarks: {info['max_rss'] / 1e6:.1f} MB")
+    except ImportError:
+        pass
+    if args.save:
+        with open(args.save, "w") as fp:
+            json.dump({"info": info, "results": results}, fp, indent=1)
+    if args.compare:
+        with open(args.compare) as fp:
+            baseline = json.load(fp)
+        if compare(results, baseline["results"], args.tolerance):
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
+
+# Variables:
+# End:
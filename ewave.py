@@ -6,8 +6,8 @@ Differences from wave.py in the python standard library (on which much of this
 is based):
 
 * Support is provided for reading and writing standard and extended format files
-  with 8, 16, 32, or 64-bit linear PCM encoding, or with 32 or 64-bit IEEE float
-  encoding.
+  with 8, 16, 24, 32, or 64-bit linear PCM encoding, or with 32 or 64-bit IEEE
+  float encoding.
 
 * Data access is through numpy.memmap whenever possible. This speeds reading
   large files and allows files to be edited in place, by opening a file in 'r+'
@@ -15,19 +15,28 @@ is based):
   as long as the data chunk is the last in the file. Files opened in 'w+' mode
   can be read after writing.
 
+* Packed 24-bit PCM is decoded to (and encoded from) 32-bit integers with the
+  sample in the upper three bytes. Because there is no native 24-bit type,
+  these files cannot be modified in place through memmaps.
+
 * A single class handles both read and write operations.
 
 * Non-accessor methods can be chained, e.g. fp.write(data).flush()
 
-Note that WAV files cannot store more than 2-4 GiB of data. Mu-law, A-law, and
-other exotic encoding schemes are not supported. Does not support bit packings
-where the container sizes don't correspond to mmapable types (e.g. 24 bit). Try
+* Files larger than 4 GiB are supported through the RF64/BW64 extension. New
+  files reserve space for a ds64 chunk and are converted from RIFF to RF64 when
+  the data chunk grows past the limit of the 32-bit size fields.
+
+Mu-law, A-law, and other exotic encoding schemes are not supported. Try
 libsndfile for those sorts of files.
 
 Copyright (C) 2012-2023 Dan Meliza <dan // AT // meliza.org>
 
 """
 
+import threading
+import time
+from collections.abc import AsyncIterator, Callable, Iterable, Iterator
 from pathlib import Path
 from typing import BinaryIO
 
@@ -45,6 +54,37 @@ WAVE_FORMAT_PCM = 0x0001
 WAVE_FORMAT_IEEE_FLOAT = 0x0003
 WAVE_FORMAT_EXTENSIBLE = 0xFFFE
 
+# size fields in RF64 files are set to this value, with the real sizes in ds64
+_RF64_SIZE = 0xFFFFFFFF
+# largest file that will be written as RIFF before switching to RF64
+_RIFF_MAX = _RF64_SIZE
+
+# number of bytes to read when parsing headers
+_HEADER_PEEK = 4096
+
+# number of files handled by each task in scan()
+_SCAN_BATCH = 64
+
+# number of samples processed at a time when data have to be converted
+_BLOCKSIZE = 1 << 18
+
+# number of samples converted at a time from float to integer types by
+# rescale(), which is small enough for the temporary buffer to stay in cache
+_RESCALE_BLOCK = 1 << 16
+
+# conversion functions made by _rescaler(), by (source dtype, target dtype)
+_rescalers = {}
+
+# maximum number of threads in the pool used by aopen()
+_AIO_WORKERS = 16
+_aio_default_executor = None
+# files opened by aopen() in 'r' mode, by absolute path
+_aio_handles = {}
+_aio_lock = threading.Lock()
+
+# function called with (operation, bytes, seconds) by instrumented code
+_tracer = None
+
 __version__ = "1.0.12"
 
 
@@ -55,14 +95,39 @@ class Error(Exception):
 class wavfile:
     """A WAVE file for reading and/or writing.
 
-    file:          the path of the file to open, or an open file-like object
+    file:          the path of the file to open, an open file-like object, or
+                   a buffer (bytes, bytearray, memoryview, or mmap) holding
+                   the contents of a file. Data in buffers and io.BytesIO
+                   objects opened for reading are not copied; see read().
     mode:          the mode to open the file (r, r+, w, w+). If already open,
-                   uses the file's handle.
+                   uses the file's handle, or this value if the file-like
+                   object doesn't have a mode (e.g. io.BytesIO).
     sampling_rate: for 'w' mode only, set the sampling rate of the data
     dtype:         for 'w' mode only, set the storage format using one of the following codes:
                    'b','h','i','l':  8,16,32,64-bit PCM
                    'f','d':  32,64-bit IEEE float
     nchannels:     for 'w' mode only, set the number of channels to store
+    sampwidth:     for 'w' mode only, the number of bytes used to store each
+                   sample, if different from the size of dtype. Use
+                   sampwidth=3 with an integer dtype for packed 24-bit PCM.
+    nframes:       for 'w' and 'w+' modes only, the number of frames that will
+                   be stored. The data region is preallocated and the header is
+                   written with the final sizes. In 'w+' mode, the data can be
+                   filled in through the writable memmap returned by
+                   read(memmap='r+'), which can be shared by multiple threads.
+                   Calls to write() fill the preallocated region sequentially.
+    header_update: for writable files, when to update the size fields in the
+                   header (besides when the file is closed):
+                   'flush':  when flush() is called (the default)
+                   'every_write':  after every call to write() or flush()
+                   'interval=S':  by write() or flush() if at least S seconds
+                                  have passed since the last update
+                   'bytes=N':  by write() or flush() if at least N bytes have
+                               been written since the last update
+                   'on_close':  only when the file is closed
+    header_cache:  for 'r' and 'r+' modes only, a HeaderCache used to look up
+                   the header instead of parsing it. Parsed headers are stored
+                   in the cache.
 
     additional keyword arguments are ignored
 
@@ -78,33 +143,68 @@ class wavfile:
         sampling_rate: int = 20000,
         dtype: npt.DTypeLike = "h",
         nchannels: int = 1,
+        sampwidth: int | None = None,
+        nframes: int | None = None,
+        header_update: str = "flush",
+        header_cache: "HeaderCache | None" = None,
         **kwargs,
     ):
+        import mmap
         from builtins import open  # noqa: UP029
 
+        tracer = _tracer
+        if tracer is not None:
+            start = time.perf_counter()
         # validate arguments; props are overwritten if header is read
         self._dtype = np.dtype(dtype)
         self._nchannels = int(nchannels)
         self._framerate = int(sampling_rate)
         self._file_format(self._dtype)
-
-        if hasattr(file, "read"):
+        self._mapping = None
+        self._map_pad = 0
+        # creating mappings moves the file position, and reads with
+        # memmap='r' can come from several threads
+        self._map_lock = threading.RLock()
+        self._mode = mode
+        self._header_update = _parse_header_update(header_update)
+        self._sampwidth = self._dtype.itemsize
+        if sampwidth is not None and sampwidth != self._sampwidth:
+            if sampwidth != 3 or self._dtype.kind != "i":
+                raise Error(f"unsupported sample width {sampwidth} for {self._dtype}")
+            # packed samples are exchanged with the caller as 32-bit integers
+            self._dtype = np.dtype("<i")
+            self._sampwidth = 3
+
+        if isinstance(file, (bytes, bytearray, memoryview, mmap.mmap)):
+            self.fp = _BufferFile(file)
+        elif hasattr(file, "read"):
             self.fp = file
         else:
             if mode not in ("r", "r+", "w", "w+"):
                 raise ValueError("Invalid mode (use 'r', 'r+', 'w', 'w+')")
             self.fp = open(file, mode=mode + "b")
+        # in-memory data are exposed directly instead of being mapped
+        if self.mode == "r" and hasattr(self.fp, "getbuffer"):
+            self._buffer = self.fp.getbuffer()
+        else:
+            self._buffer = None
 
         if self.mode == "r":
-            self._load_header()
+            self._load_header(header_cache)
         elif self.mode == "r+":
             try:
-                self._load_header()
+                self._load_header(header_cache)
             except EOFError:
                 # file is empty; needs header
                 self._write_header(sampling_rate, dtype, nchannels)
+                if nframes is not None:
+                    self._preallocate(nframes)
         else:
             self._write_header(sampling_rate, dtype, nchannels)
+            if nframes is not None:
+                self._preallocate(nframes)
+        if tracer is not None:
+            tracer("open", 0, time.perf_counter() - start)
 
     def __enter__(self):
         return self
@@ -114,19 +214,25 @@ class wavfile:
 
     def __del__(self):
         if hasattr(self, "fp") and hasattr(self.fp, "close"):
-            self.flush()
-            self.fp.close()
+            self._flush("close")
+            self._mapping = self._buffer = None
+            try:
+                self.fp.close()
+            except BufferError:
+                # io.BytesIO can't be closed while arrays returned by read()
+                # are still using its buffer
+                pass
             del self.fp
 
     @property
     def filename(self) -> str:
         """The path of the file"""
-        return self.fp.name
+        return getattr(self.fp, "name", None)
 
     @property
     def mode(self) -> str:
         """The mode for the file"""
-        return self.fp.mode.replace("b", "")
+        return getattr(self.fp, "mode", self._mode).replace("b", "")
 
     @property
     def sampling_rate(self) -> int:
@@ -141,35 +247,197 @@ class wavfile:
         if hasattr(self, "_bytes_written"):
             nbytes = self._bytes_written
         else:
-            nbytes = self._data_chunk.chunksize
-        return nbytes // (self.dtype.itemsize * self.nchannels)
+            nbytes = self._data_size
+        return nbytes // (self._sampwidth * self.nchannels)
 
     @property
     def dtype(self) -> np.dtype:
-        """Data storage type"""
+        """Data storage type. For packed 24-bit files this is a 32-bit integer."""
         return self._dtype
 
+    @property
+    def sampwidth(self) -> int:
+        """Number of bytes used to store each sample in the file"""
+        return self._sampwidth
+
     def __repr__(self) -> str:
         return f"<open {self.__class__.__module__}.{self.__class__.__name__} '{self.filename}', mode '{self.mode}', dtype '{self.dtype}', sampling rate {self.sampling_rate} at {hex(id(self))}>"
 
     def flush(self):
-        """Flushes data to disk and update header with correct size information"""
-        import struct
+        """Flushes data to disk and, if the header update policy allows, updates
+        the header with correct size information"""
+        return self._flush("flush")
 
+    def _flush(self, trigger: str):
         if self.mode == "r":
-            return
-        self.fp.seek(4)
-        self.fp.write(struct.pack(b"<L", self._data_offset + self._bytes_written - 8))
-        self.fp.seek(self._data_offset - 4)
-        self.fp.write(struct.pack(b"<L", self._bytes_written))
+            return self
+        tracer = _tracer
+        if tracer is not None:
+            start = time.perf_counter()
+        if self._mapping is not None:
+            self._mapping.flush()
+        # data go to disk before the header says they're there
         self.fp.flush()
+        if self._header_due(trigger):
+            self._write_sizes()
+        if tracer is not None:
+            tracer("flush", 0, time.perf_counter() - start)
         return self
 
+    def _header_due(self, trigger: str) -> bool:
+        """Returns True if the header should be updated now.
+
+        trigger is 'write', 'flush', or 'close'
+        """
+        if self._bytes_written == self._header_bytes:
+            return False
+        policy, value = self._header_update
+        if trigger == "close" or policy == "every_write":
+            return True
+        if policy == "flush":
+            return trigger == "flush"
+        if policy == "interval":
+            return time.monotonic() - self._header_time >= value
+        if policy == "bytes":
+            return abs(self._bytes_written - self._header_bytes) >= value
+        return False
+
+    def _write_at(self, offset: int, data: bytes):
+        """Writes data at offset without moving the file position"""
+        import os
+
+        try:
+            fd = self.fp.fileno()
+        except (AttributeError, OSError):
+            fd = None
+        if fd is not None and hasattr(os, "pwrite"):
+            os.pwrite(fd, data, offset)
+        else:
+            pos = self.fp.tell()
+            self.fp.seek(offset)
+            self.fp.write(data)
+            self.fp.seek(pos)
+
+    def _write_sizes(self):
+        """Updates the size fields in the header, converting to RF64 if needed.
+
+        Any buffered data need to be flushed first.
+        """
+        import struct
+
+        riff_size = self._data_offset + self._bytes_written - 8
+        if self._rf64 or riff_size > _RIFF_MAX:
+            if self._ds64_offset is None:
+                raise Error("file too large for RIFF and no space for ds64 chunk")
+            sizes = struct.pack(b"<QQQ", riff_size, self._bytes_written, self.nframes)
+            if self._rf64:
+                # leave the length and any table of an existing ds64 chunk alone
+                self._write_at(self._ds64_offset + 8, sizes)
+            else:
+                self._write_at(
+                    self._ds64_offset,
+                    struct.pack(b"<4sL", b"ds64", 28) + sizes + struct.pack(b"<L", 0),
+                )
+                self._write_at(0, struct.pack(b"<4sL", b"RF64", _RF64_SIZE))
+                self._write_at(self._data_offset - 4, struct.pack(b"<L", _RF64_SIZE))
+                self._rf64 = True
+        else:
+            self._write_at(
+                self._data_offset - 4, struct.pack(b"<L", self._bytes_written)
+            )
+            self._write_at(4, struct.pack(b"<L", riff_size))
+        self._header_bytes = self._bytes_written
+        if self._header_update[0] == "interval":
+            self._header_time = time.monotonic()
+
+    def _preallocate(self, nframes: int):
+        """Allocates space for nframes of data and writes the final header"""
+        import os
+
+        nbytes = nframes * self.nchannels * self._sampwidth
+        if self._ds64_offset is None and self._data_offset + nbytes - 8 > _RIFF_MAX:
+            raise Error("file too large for RIFF and no space for ds64 chunk")
+        self.fp.flush()
+        try:
+            os.posix_fallocate(self.fp.fileno(), self._data_offset, nbytes)
+        except (AttributeError, OSError):
+            # not supported by the platform or filesystem
+            self.fp.truncate(self._data_offset + nbytes)
+        self._bytes_written = nbytes
+        self._write_sizes()
+        if self.mode != "w" and nbytes > 0:
+            self._map(nbytes)
+
+    def _map(self, nbytes: int) -> np.memmap:
+        """Returns a memmap covering at least the first nbytes of the data.
+
+        The mapping is created on the first call and reused by later ones, so
+        that repeated reads don't each need a new mmap. It's replaced by a
+        larger one if the data have grown past the end. The mapping is
+        read-only if the file is. Packed 24-bit data are mapped as bytes,
+        starting one byte before the data chunk (see _unpack24).
+        """
+        mapping = self._mapping
+        if mapping is not None and mapping.nbytes - self._map_pad >= nbytes:
+            return mapping
+        with self._map_lock:
+            # another thread may have made the mapping while this one waited
+            mapping = self._mapping
+            if mapping is not None and mapping.nbytes - self._map_pad >= nbytes:
+                return mapping
+            if self.mode in ("r+", "w+"):
+                self.fp.flush()
+            size = max(nbytes, self.nframes * self.nchannels * self._sampwidth)
+            mode = "r" if self.mode == "r" else "r+"
+            if self._sampwidth == 3:
+                self._map_pad = 1
+                mapping = self._memmap(self._data_offset - 1, "B", mode, size + 1)
+            else:
+                self._map_pad = 0
+                mapping = self._memmap(
+                    self._data_offset, self._dtype, mode, size // self._dtype.itemsize
+                )
+            self._mapping = mapping
+        return mapping
+
+    def _memmap(
+        self, offset: int, dtype: npt.DTypeLike, mode: str, count: int
+    ) -> np.ndarray:
+        """Maps count items of dtype, starting offset bytes into the file.
+
+        The file position is not changed. In-memory data are wrapped with
+        np.frombuffer (truncated if the buffer is short), and members of
+        archives are mapped from the archive file.
+        """
+        if self._buffer is not None:
+            dtype = np.dtype(dtype)
+            offset = min(offset, len(self._buffer))
+            count = min(count, (len(self._buffer) - offset) // dtype.itemsize)
+            return np.frombuffer(self._buffer, dtype=dtype, count=count, offset=offset)
+        tracer = _tracer
+        if tracer is not None:
+            start = time.perf_counter()
+        fp = self.fp
+        if isinstance(fp, _FileSection):
+            fp, offset = fp.fileobj, fp.start + offset
+        # np.memmap leaves the file at the end, where write() would pick up
+        with self._map_lock:
+            pos = fp.tell()
+            A = np.memmap(fp, offset=offset, dtype=dtype, mode=mode, shape=count)
+            fp.seek(pos)
+        if tracer is not None:
+            tracer("map", A.nbytes, time.perf_counter() - start)
+        return A
+
     def read(
         self,
         frames: int | None = None,
         offset: int = 0,
         memmap: str | bool | None = "c",
+        channels: int | slice | Iterable[int] | None = None,
+        layout: str = "interleaved",
+        out: np.ndarray | None = None,
+        dtype: npt.DTypeLike | None = None,
     ) -> np.ndarray:
         """Returns acoustic data from file.
 
@@ -187,30 +455,85 @@ class wavfile:
                   a numpy.memmap object using this value as the mode argument. 'c'
                   corresponds to copy-on-write; use 'r+' to write changes to disk. Be
                   warned that 'w' modes may corrupt data. Memmap may not work with
-                  certain input types (e.g., files in zip archives) and does not currently work
-                  on Windows.
+                  certain input types (e.g., compressed files in zip archives) and does not
+                  currently work on Windows.
+        - channels: if not None, the channel or channels to return. Selections
+                    that can be expressed as a slice (e.g., [0, 2, 4]) return
+                    views of the data; others are copied.
+        - layout: 'interleaved' (the default) returns frames x channels.
+                  'planar' returns a new C-contiguous array of channels x
+                  frames, which is gathered from the file in blocks.
+        - out: if not None, an array where the data are stored (e.g., a
+               reusable buffer or one in shared memory), with the shape that
+               read() would return. If frames is None, the number of frames
+               is taken from the shape of out. Returns the part of out that
+               was filled, which is shorter if the end of the file is reached.
+        - dtype: if not None, the data are rescaled to this type (see
+                 rescale()). Defaults to the dtype of out, if it's given.
+
+        Selecting a single channel with an integer returns a 1D array in
+        either layout. Files with one channel can be read as 'planar', which
+        returns an array of shape 1 x frames.
+
+        In 'r' and 'r+' modes, the returned memmap is a view into a mapping of
+        the data that is shared by all calls to read() on this object, so these
+        are the fastest modes for repeated reads. Each read in 'c' mode creates
+        a new mapping, so that changes to one array aren't seen in others.
+
+        For files opened from buffers or io.BytesIO objects, the returned
+        array is always a read-only view of the buffer, regardless of memmap.
+        Files opened with open_member() from uncompressed archives are mapped
+        directly from the archive file.
+
+        Packed 24-bit data are always decoded into a new array of 32-bit
+        integers, so memmap may only be False, 'r', or 'c' for these files.
+
+        If out or dtype are given, memmap is ignored and data are copied. If
+        no conversion is needed and all the channels are read into a
+        contiguous array in interleaved layout, the data are read into it
+        with readinto(). Otherwise, the data are rescaled into it straight
+        from the shared read-only mapping.
 
         """
         if self.mode == "w":
             raise Error("file is write-only")
+        if layout not in ("interleaved", "planar"):
+            raise ValueError("Invalid layout (use 'interleaved', 'planar')")
+        tracer = _tracer
+        if tracer is not None:
+            start = time.perf_counter()
+        if out is not None or dtype is not None:
+            A = self._read_into(frames, offset, channels, layout, out, dtype)
+            if tracer is not None:
+                tracer("read", A.nbytes, time.perf_counter() - start)
+            return A
         if self.mode in ("r+", "w+"):
             self.fp.flush()
         # find offset
-        coff = self._data_offset + offset * self.nchannels * self._dtype.itemsize
+        coff = self._data_offset + offset * self.nchannels * self._sampwidth
         if frames is None:
             frames = self.nframes - offset
-        if memmap:
-            A = np.memmap(
-                self.fp,
-                offset=coff,
-                dtype=self._dtype,
-                mode=memmap,
-                shape=frames * self.nchannels,
-            )
+        if self._sampwidth == 3:
+            A = self._read_packed(coff, frames * self.nchannels, memmap)
+        elif (
+            memmap == "r"
+            or (memmap == "r+" and self.mode != "r")
+            or self._buffer is not None
+        ):
+            lo = offset * self.nchannels
+            hi = lo + frames * self.nchannels
+            if hi == 0:
+                A = np.empty(0, dtype=self._dtype)
+            else:
+                A = self._map(hi * self._sampwidth)[lo:hi]
+            if memmap == "r" or self._buffer is not None:
+                A.flags.writeable = False
+        elif memmap:
+            A = self._memmap(coff, self._dtype, memmap, frames * self.nchannels)
         else:
             pos = self.fp.tell()
             self.fp.seek(coff)
-            data = self.fp.read(frames * self.nchannels * self._dtype.itemsize)
+            data = self.fp.read(frames * self.nchannels * self._sampwidth)
             A = np.frombuffer(data, dtype=self._dtype)
             self.fp.seek(pos)
 
@@ -218,9 +541,532 @@ class wavfile:
             nsamples = (A.size // self.nchannels) * self.nchannels
             A = A[:nsamples]
             A.shape = (nsamples // self.nchannels, self.nchannels)
+        if channels is not None or layout != "interleaved":
+            A = self._select_channels(A, channels, layout)
+        if tracer is not None:
+            tracer("read", A.nbytes, time.perf_counter() - start)
         return A
 
-    def write(self, data: npt.ArrayLike, scale: bool = True):
+    def _read_into(
+        self,
+        frames: int | None,
+        offset: int,
+        channels: int | slice | Iterable[int] | None,
+        layout: str,
+        out: np.ndarray | None,
+        dtype: npt.DTypeLike | None,
+    ) -> np.ndarray:
+        """Implements read() with out or dtype"""
+        dtype = np.dtype(out.dtype if dtype is None else dtype)
+        if out is not None and out.dtype != dtype:
+            raise ValueError(f"out has dtype {out.dtype} but target is {dtype}")
+        planar = layout == "planar"
+        # the shape of the selected channels in one frame
+        if channels is None and not planar:
+            selected = (self.nchannels,) if self.nchannels > 1 else ()
+        else:
+            index = slice(None) if channels is None else channels
+            selected = np.empty((0, self.nchannels))[:, index].shape[1:]
+        if frames is None:
+            if out is None:
+                frames = self.nframes - offset
+            else:
+                frames = out.shape[-1] if planar else out.shape[0]
+        frames = max(0, frames)
+        n = max(0, min(frames, self.nframes - offset))
+        if out is None:
+            out = np.empty((*selected, n) if planar else (n, *selected), dtype=dtype)
+        else:
+            expected = (*selected, frames) if planar else (frames, *selected)
+            if out.shape != expected:
+                raise ValueError(f"out must have shape {expected}, not {out.shape}")
+            out = out[..., :n] if planar else out[:n]
+        if n == 0:
+            return out
+
+        if (
+            channels is None
+            and not planar
+            and dtype == self._dtype
+            and out.flags.c_contiguous
+        ):
+            coff = self._data_offset + offset * self.nchannels * self._sampwidth
+            if self._sampwidth == 3:
+                A = self._read_packed(coff, out.size, False, out.reshape(-1))
+                if A.size < out.size:
+                    raise Error("file is shorter than its data chunk")
+                return out
+            if self.mode in ("r+", "w+"):
+                self.fp.flush()
+            pos = self.fp.tell()
+            self.fp.seek(coff)
+            view = memoryview(out).cast("B")
+            done = 0
+            while done < len(view):
+                count = self.fp.readinto(view[done:])
+                if not count:
+                    break
+                done += count
+            self.fp.seek(pos)
+            if done < len(view):
+                raise Error("file is shorter than its data chunk")
+            return out
+
+        A = self.read(n, offset, memmap="r", channels=channels)
+        if not planar:
+            return rescale(A, dtype, out=out)
+        # transpose blocks of frames so they stay in cache
+        rows = max(1, _BLOCKSIZE // max(1, A.size // n))
+        for i in range(0, n, rows):
+            rescale(A[i : i + rows].T, dtype, out=out[..., i : i + rows])
+        return out
+
+    def _select_channels(
+        self, A: np.ndarray, channels: int | slice | Iterable[int] | None, layout: str
+    ) -> np.ndarray:
+        """Selects channels from the output of read() and rearranges them"""
+        import operator
+
+        if A.ndim == 1:
+            A = A[:, np.newaxis]
+        if channels is None:
+            channels = slice(None)
+        elif not isinstance(channels, slice):
+            try:
+                channels = operator.index(channels)
+            except TypeError:
+                channels = _as_slice(channels, self.nchannels)
+        if layout == "interleaved":
+            return A[:, channels]
+        # gather blocks of frames so the transposition stays in cache
+        shape = A[:0, channels].T.shape
+        out = np.empty((*shape[:-1], A.shape[0]), dtype=A.dtype)
+        rows = max(1, _BLOCKSIZE // A.shape[1])
+        for i in range(0, A.shape[0], rows):
+            out[..., i : i + rows] = A[i : i + rows, channels].T
+        return out
+
+    def as_array(self, dtype: npt.DTypeLike = "float32") -> "WaveArray":
+        """Returns a lazy array-like view of the data, rescaled to dtype.
+
+        Data are only read and rescaled when the view is indexed, and only for
+        the frames and channels that were selected. See WaveArray.
+        """
+        return WaveArray(self, dtype)
+
+    def share(
+        self, dtype: npt.DTypeLike | None = None, name: str | None = None
+    ) -> "SharedData":
+        """Copies the data into a new block of shared memory.
+
+        Other processes can attach to the block without copying the data (see
+        SharedData). The data are read straight into the block, as
+        read(out=...).
+
+        - dtype: if not None, the data are rescaled to this type
+        - name: the name of the block. If None, a unique name is chosen.
+        """
+        return SharedData.create(self, dtype, name)
+
+    def envelope(
+        self, binsize: int = 256, factor: int = 4, workers: int | None = None
+    ) -> "Envelope":
+        """Computes a min/max/RMS pyramid of the data for drawing overviews.
+
+        The data are read in blocks in one pass, using a pool of threads, and
+        reduced to bins of binsize frames. Each coarser level of the pyramid
+        combines factor bins of the level below it. See Envelope, and
+        build_peaks() for a version that caches the result next to the file.
+
+        - binsize: the number of frames in each bin of the finest level
+        - factor: the number of bins combined into each bin of the next level
+        - workers: the maximum number of threads to use. If None, uses the
+                   default for concurrent.futures.ThreadPoolExecutor
+        """
+        from concurrent.futures import ThreadPoolExecutor
+
+        if binsize < 1:
+            raise ValueError("binsize must be positive")
+        if factor < 2:
+            raise ValueError("factor must be at least 2")
+        nframes = self.nframes
+        nbins = -(-nframes // binsize)
+        level = np.zeros((nbins, self.nchannels), dtype=Envelope.dtype)
+        # mean squares are kept in double precision until the pyramid is built
+        power = np.zeros((nbins, self.nchannels), dtype="d")
+        rows = max(1, _BLOCKSIZE // (self.nchannels * binsize)) * binsize
+
+        def reduce_block(start):
+            block = self.read(min(rows, nframes - start), start, memmap="r")
+            block = block.reshape(block.shape[0], self.nchannels)
+            edges = np.arange(0, block.shape[0], binsize)
+            first = start // binsize
+            out = level[first : first + edges.size]
+            # rescaling is monotonic, so the extremes can be found first
+            rescale(np.minimum.reduceat(block, edges), "f", out=out["min"])
+            rescale(np.maximum.reduceat(block, edges), "f", out=out["max"])
+            sq = np.square(rescale(block, "d"))
+            np.add.reduceat(sq, edges, out=power[first : first + edges.size])
+
+        with ThreadPoolExecutor(workers) as pool:
+            for _ in pool.map(reduce_block, range(0, nframes, rows)):
+                pass
+        counts = np.full(nbins, binsize, dtype="i8")
+        if nbins:
+            counts[-1] = nframes - (nbins - 1) * binsize
+        levels = []
+        while True:
+            level["rms"] = np.sqrt(power / counts[:, np.newaxis])
+            levels.append(level)
+            if level.shape[0] <= 1:
+                break
+            edges = np.arange(0, level.shape[0], factor)
+            coarse = np.empty((edges.size, self.nchannels), dtype=Envelope.dtype)
+            coarse["min"] = np.minimum.reduceat(level["min"], edges)
+            coarse["max"] = np.maximum.reduceat(level["max"], edges)
+            power = np.add.reduceat(power, edges)
+            counts = np.add.reduceat(counts, edges)
+            level = coarse
+        return Envelope(levels, binsize, factor, nframes, self.sampling_rate)
+
+    def summary(
+        self,
+        channels: int | slice | Iterable[int] | None = None,
+        workers: int | None = None,
+    ) -> np.ndarray:
+        """Computes summary statistics for each channel in one pass over the data.
+
+        The data are read in blocks from the shared read-only mapping, using a
+        pool of threads. Each block is gathered into planar layout, and the
+        statistics are accumulated without rescaling the data. Integer data
+        are summed in 64-bit integers if that is exact.
+
+        - channels: if not None, the channel or channels to summarize
+        - workers: the maximum number of threads to use. If None, uses the
+                   default for concurrent.futures.ThreadPoolExecutor
+
+        Returns a structured array of records with dtype summary_dtype, one
+        for each channel (or a single record if channels is an integer).
+        Values are on the scale used by rescale() for floats:
+
+        min, max, peak:  the smallest, largest, and largest absolute values
+        rms:  the root-mean-square value
+        dc:  the mean value
+        clipped:  the number of samples at the limits of the integer range, or
+                  for floating-point data, with absolute values of 1 or more
+        nan:  the number of NaN samples, which are excluded from the other
+              statistics
+
+        See summarize() for a version that caches the result next to the file.
+        """
+        from concurrent.futures import ThreadPoolExecutor
+
+        dtype = self._dtype
+        nframes = self.nframes
+        rows = max(1, _BLOCKSIZE // self.nchannels)
+        # check the selection and find the number of channels in it
+        selected = np.empty((0, self.nchannels))[:, channels]
+        if dtype.kind == "f":
+            scale, offset = 1.0, 0
+        else:
+            info = np.iinfo(dtype)
+            lo, hi = info.min, info.max
+            if self._sampwidth == 3:
+                # the low byte of unpacked samples is always zero
+                hi &= -256
+            elif dtype.itemsize == 8:
+                # rescale() clips floats to the largest double below the limit
+                hi = int(np.nextafter(float(1 << 63), 0))
+            # unsigned samples are centered on the middle of the range
+            offset = (info.max + 1) // 2 if dtype.kind == "u" else 0
+            scale = 1.0 / (1 << (dtype.itemsize * 8 - 1))
+            # squares of 8 and 16-bit samples can't overflow a 64-bit sum
+            acc = np.dtype("i8") if dtype.itemsize <= 2 else np.dtype("d")
+
+        def reduce_block(start):
+            n = min(rows, nframes - start)
+            # reductions along contiguous rows are much faster than along
+            # the frames of interleaved data
+            block = self.read(n, start, memmap="r", channels=channels, layout="planar")
+            block = block.reshape(-1, n)
+            nans = np.zeros(block.shape[0], dtype="i8")
+            if dtype.kind == "f":
+                total = block.sum(1, dtype="d")
+                if np.isnan(total).any():
+                    nan = np.isnan(block)
+                    nans = nan.sum(1)
+                    block = np.where(nan, 0, block)
+                    lows = np.where(nan, np.inf, block).min(1)
+                    highs = np.where(nan, -np.inf, block).max(1)
+                    total = block.sum(1, dtype="d")
+                else:
+                    lows, highs = block.min(1), block.max(1)
+                squares = np.einsum("ij,ij->i", block, block, dtype="d")
+                clipped = np.zeros(block.shape[0], dtype="i8")
+                if (lows <= -1).any() or (highs >= 1).any():
+                    clipped = np.count_nonzero(np.abs(block) >= 1, axis=1)
+            else:
+                lows, highs = block.min(1), block.max(1)
+                total = block.sum(1, dtype=acc)
+                squares = np.einsum("ij,ij->i", block, block, dtype=acc)
+                if offset:
+                    # sum((x - offset)**2), expanded to avoid a centered copy
+                    squares = squares - 2 * offset * total + n * offset**2
+                    total = total - n * offset
+                clipped = np.zeros(block.shape[0], dtype="i8")
+                if (lows <= lo).any() or (highs >= hi).any():
+                    clipped = np.count_nonzero(block <= lo, axis=1)
+                    clipped += np.count_nonzero(block >= hi, axis=1)
+            return lows, highs, clipped, nans, total, squares
+
+        with ThreadPoolExecutor(workers) as pool:
+            parts = list(pool.map(reduce_block, range(0, nframes, rows)))
+        out = np.zeros(selected.shape[1:] or 1, dtype=summary_dtype)
+        if parts:
+            lows, highs, clipped, nans, total, squares = zip(*parts, strict=True)
+            out["min"] = (np.min(lows, 0).astype("d") - offset) * scale
+            out["max"] = (np.max(highs, 0).astype("d") - offset) * scale
+            out["clipped"] = np.sum(clipped, 0)
+            out["nan"] = np.sum(nans, 0)
+            count = nframes - out["nan"]
+            with np.errstate(invalid="ignore", divide="ignore"):
+                out["dc"] = np.sum(total, 0) * scale / count
+                out["rms"] = np.sqrt(np.sum(squares, 0) / count) * scale
+            out["peak"] = np.maximum(np.abs(out["min"]), np.abs(out["max"]))
+        else:
+            for field in ("min", "max", "peak", "rms", "dc"):
+                out[field] = np.nan
+        return out if selected.ndim == 2 else out[0]
+
+    def iter_blocks(
+        self,
+        blocksize: int,
+        overlap: int = 0,
+        offset: int = 0,
+        frames: int | None = None,
+        dtype: npt.DTypeLike | None = None,
+    ) -> Iterator[np.ndarray]:
+        """Iterates through the acoustic data in blocks.
+
+        Blocks are read-only views into a single memmap of the data, so no data
+        are copied. Consecutive blocks share overlap frames, and the last block
+        may be shorter than blocksize. The kernel is advised that the data will
+        be accessed sequentially, and to read ahead each block before it's
+        yielded.
+
+        - blocksize: the number of frames in each block
+        - overlap: the number of frames shared by consecutive blocks
+        - offset: start iterating at this frame
+        - frames: the number of frames to iterate through. None for all the frames
+                  after offset.
+        - dtype: if not None, each block is rescaled to this type. The same output
+                 buffer is reused for every block, so copy it if you need to keep
+                 it after the next iteration.
+
+        Packed 24-bit data cannot be memory mapped, so each block is decoded
+        separately.
+        """
+        from numpy.lib.stride_tricks import as_strided
+
+        if blocksize < 1:
+            raise ValueError("blocksize must be positive")
+        if not 0 <= overlap < blocksize:
+            raise ValueError("overlap must be nonnegative and less than blocksize")
+        if frames is None:
+            frames = self.nframes - offset
+        step = blocksize - overlap
+        nblocks = max(0, (frames - blocksize) // step + 1)
+        if self._sampwidth == 3:
+            A = None
+            blocks = (
+                self.read(blocksize, offset + i * step, memmap="r")
+                for i in range(nblocks)
+            )
+        else:
+            A = self.read(frames, offset, memmap="r")
+            _madvise(A, "MADV_SEQUENTIAL")
+            blocks = as_strided(
+                A,
+                shape=(nblocks, blocksize, *A.shape[1:]),
+                strides=(step * A.strides[0], *A.strides),
+                writeable=False,
+            )
+        buf = None
+        if dtype is not None and np.dtype(dtype) != self._dtype:
+            shape = (blocksize, self.nchannels) if self.nchannels > 1 else (blocksize,)
+            buf = np.empty(shape, dtype=dtype)
+
+        def emit(block):
+            if buf is None:
+                return block
+            return rescale(block, buf.dtype, out=buf[: block.shape[0]])
+
+        framesize = self.nchannels * self._dtype.itemsize
+        for i, block in enumerate(blocks):
+            if A is not None:
+                _madvise(
+                    A,
+                    "MADV_WILLNEED",
+                    (i + 1) * step * framesize,
+                    blocksize * framesize,
+                )
+            yield emit(block)
+        # remaining frames that weren't in a full block
+        start = nblocks * step
+        if nblocks == 0 or start + overlap < frames:
+            if A is not None:
+                block = A[start:]
+            else:
+                block = self.read(frames - start, offset + start, memmap="r")
+            if block.shape[0] > 0:
+                yield emit(block)
+
+    def follow(
+        self,
+        poll_interval: float = 0.05,
+        blocksize: int | None = None,
+        offset: int = 0,
+        timeout: float | None = None,
+    ) -> Iterator[np.ndarray]:
+        """Yields data as they are appended to the file by another process.
+
+        Every poll_interval seconds, the size fields in the header and the
+        length of the file are checked to see if new data have been written.
+        The file length is used when the writer hasn't updated the header, so
+        data are seen as soon as they reach the disk. Only the newly written
+        data are mapped.
+
+        - poll_interval: the time (in s) to wait between checks for new data
+        - blocksize: if None, yields all the new frames after each check.
+                     Otherwise, yields blocks of exactly this many frames.
+        - offset: the frame to start at
+        - timeout: stop after this many seconds without new data, or None to
+                   continue indefinitely. Any frames that haven't been yielded
+                   because they don't fill a block are yielded before stopping.
+
+        Only works for files opened in 'r' mode. See afollow for a version
+        that can be used with asyncio.
+        """
+        for block in self._follow(blocksize, offset, timeout):
+            if block is None:
+                time.sleep(poll_interval)
+            else:
+                yield block
+
+    async def afollow(
+        self,
+        poll_interval: float = 0.05,
+        blocksize: int | None = None,
+        offset: int = 0,
+        timeout: float | None = None,
+    ) -> AsyncIterator[np.ndarray]:
+        """Asynchronously yields data as they are appended to the file.
+
+        Arguments are the same as follow().
+        """
+        import asyncio
+
+        for block in self._follow(blocksize, offset, timeout):
+            if block is None:
+                await asyncio.sleep(poll_interval)
+            else:
+                yield block
+
+    def _follow(
+        self, blocksize: int | None, offset: int, timeout: float | None
+    ) -> Iterator[np.ndarray | None]:
+        """Yields blocks of new data, or None when the caller should wait"""
+        if self.mode != "r":
+            raise Error("can only follow files opened in 'r' mode")
+        if blocksize is not None and blocksize < 1:
+            raise ValueError("blocksize must be positive")
+        # the cached mapping would be replaced every time the file grows, so
+        # each range of new data is mapped separately
+        memmap = False if self._sampwidth == 3 else "c"
+        pos = offset
+        last_nframes = -1
+        last_growth = time.monotonic()
+        while True:
+            nframes = self._poll_nframes()
+            if nframes != last_nframes:
+                last_nframes = nframes
+                last_growth = time.monotonic()
+            if blocksize is None:
+                end = nframes
+            else:
+                end = pos + (nframes - pos) // blocksize * blocksize
+            if end > pos:
+                data = self.read(end - pos, pos, memmap=memmap)
+                step = blocksize or end - pos
+                for i in range(0, end - pos, step):
+                    yield data[i : i + step]
+                pos = end
+            elif timeout is not None and time.monotonic() - last_growth >= timeout:
+                if nframes > pos:
+                    yield self.read(nframes - pos, pos, memmap=memmap)
+                return
+            else:
+                yield None
+
+    def _poll_nframes(self) -> int:
+        """Updates the size of the data from the header and the file length"""
+        import os
+        import struct
+
+        fd = self.fp.fileno()
+        if hasattr(os, "pread"):
+            head = os.pread(fd, self._data_offset, 0)
+        else:
+            self.fp.seek(0)
+            head = self.fp.read(self._data_offset)
+        size = struct.unpack_from(b"<L", head, self._data_offset - 4)[0]
+        if size == _RF64_SIZE:
+            size = 0
+        if head[:4] != b"RIFF" and self._ds64_offset is not None:
+            # the file is (or has just been converted to) RF64
+            size = struct.unpack_from(b"<Q", head, self._ds64_offset + 16)[0]
+        if not self._postdata:
+            # writer may have written data without updating the header, unless
+            # the data chunk is followed by other chunks
+            length = os.fstat(fd).st_size
+            end = self._data_offset + size + (size & 1)
+            if not (size and length > end and _chunks_fill(self.fp, end, length)):
+                size = max(size, length - self._data_offset)
+        self._data_size = size
+        return self.nframes
+
+    def _read_packed(
+        self, coff: int, nsamples: int, memmap, out: np.ndarray | None = None
+    ) -> np.ndarray:
+        """Decodes nsamples of packed 24-bit data starting at byte offset coff,
+        into out if it's not None"""
+        if memmap not in (False, None, "r", "c"):
+            raise Error("packed 24-bit data cannot be modified in place")
+        if out is None:
+            out = np.empty(nsamples, dtype=self._dtype)
+        if (memmap or self._buffer is not None) and nsamples > 0:
+            start = coff - self._data_offset
+            raw = self._map(start + nsamples * 3)[start:]
+            for i in range(0, nsamples, _BLOCKSIZE):
+                j = min(i + _BLOCKSIZE, nsamples)
+                _unpack24(raw[i * 3 : j * 3 + 1], out[i:j])
+        else:
+            pos = self.fp.tell()
+            self.fp.seek(coff)
+            buf = np.empty(min(nsamples, _BLOCKSIZE) * 3 + 1, dtype="B")
+            for i in range(0, nsamples, _BLOCKSIZE):
+                want = min(nsamples - i, _BLOCKSIZE)
+                n = self.fp.readinto(buf[1 : want * 3 + 1]) // 3
+                _unpack24(buf[: n * 3 + 1], out[i : i + n])
+                if n < want:
+                    out = out[: i + n]
+                    break
+            self.fp.seek(pos)
+        return out
+
+    def write(
+        self, data: npt.ArrayLike, scale: bool = True, layout: str = "interleaved"
+    ):
         """Writes data to the WAVE file
 
         - data : input data, in any form that can be converted to an array with
@@ -230,103 +1076,187 @@ class wavfile:
         - scale : if True, data are rescaled so that their maximum range matches
                     that of the file's encoding. If not, the raw values are
                     used, which can result in clipping.
+
+        - layout : 'interleaved' (the default) or 'planar'. If 'planar', data
+                   is a sequence of 1D arrays (or a 2D array) with one element
+                   for each channel in the file, which are interleaved as they
+                   are written.
+
+        Data that need to be converted or interleaved are processed in blocks
+        through a scratch buffer, so the memory used doesn't depend on the size
+        of data.
         """
-        from numpy import asarray
+        from numpy import asarray, atleast_1d, copyto
 
         if self.mode == "r":
             raise Error("file is read-only")
-        if hasattr(self, "_postdata_chunk") and self._postdata_chunk:
+        if self._postdata:
             raise Error("cannot append to data chunk without overwriting other chunks")
 
-        if not scale:
-            data = asarray(data, self._dtype)
-        data = rescale(data, self._dtype).tobytes()
-
-        self.fp.write(data)
-        self._bytes_written += len(data)
+        if layout == "planar":
+            planes = [atleast_1d(asarray(plane)) for plane in data]
+            if len(planes) != self.nchannels:
+                raise Error(f"expected {self.nchannels} channels, got {len(planes)}")
+            nframes = planes[0].shape[0]
+            if any(plane.shape != (nframes,) for plane in planes):
+                raise Error("channels must be 1D arrays with the same length")
+            nbytes = nframes * self.nchannels * self._sampwidth
+        elif layout == "interleaved":
+            data = atleast_1d(asarray(data))
+            nbytes = data.size * self._sampwidth
+        else:
+            raise ValueError("Invalid layout (use 'interleaved', 'planar')")
+        self._check_size(nbytes)
+        tracer = _tracer
+        if tracer is not None:
+            start = time.perf_counter()
+
+        def convert(block, out):
+            if scale:
+                _rescaler(block.dtype, self._dtype)(block, out)
+            else:
+                copyto(out, block, casting="unsafe")
+
+        def write_block(out):
+            if self._sampwidth == 3:
+                out = _pack24(out, self._scratch_packed(out.size))
+            self.fp.write(memoryview(out.reshape(-1)).cast("B"))
+
+        if layout == "planar":
+            rows = max(1, _BLOCKSIZE // self.nchannels)
+            buf = self._scratch(rows * self.nchannels)
+            for i in range(0, nframes, rows):
+                n = min(rows, nframes - i)
+                out = buf[: n * self.nchannels].reshape(n, self.nchannels)
+                for j, plane in enumerate(planes):
+                    convert(plane[i : i + n], out[:, j])
+                write_block(out)
+        elif (
+            data.dtype == self._dtype
+            and data.flags.c_contiguous
+            and self._sampwidth != 3
+        ):
+            # no conversion needed, so the data can be written without copying
+            self.fp.write(memoryview(data.reshape(-1)).cast("B"))
+        else:
+            # convert blocks of rows so that non-contiguous inputs aren't copied
+            rowsize = data.size // data.shape[0] if data.shape[0] else 1
+            rows = max(1, _BLOCKSIZE // max(rowsize, 1))
+            buf = self._scratch(rows * rowsize)
+            for i in range(0, data.shape[0], rows):
+                block = data[i : i + rows]
+                out = buf[: block.size].reshape(block.shape)
+                convert(block, out)
+                write_block(out)
+        self._advance(nbytes)
+        if tracer is not None:
+            tracer("write", nbytes, time.perf_counter() - start)
         return self
 
-    def _load_header(self):
-        """Reads metadata from header"""
-        import struct
+    def _check_size(self, nbytes: int):
+        """Raises an error if nbytes more data won't fit in the file"""
+        if (
+            self._ds64_offset is None
+            and self._data_offset + self._write_pos + nbytes - 8 > _RIFF_MAX
+        ):
+            raise Error("file too large for RIFF and no space for ds64 chunk")
 
-        from numpy import dtype
-
-        fp = Chunk(self.fp, bigendian=0)
-        if fp.getname() != b"RIFF":
-            raise Error("file does not start with RIFF id")
-        if fp.read(4) != b"WAVE":
-            raise Error("not a WAVE file")
-        self._fmt_chunk = None
-        self._fact_chunk = None
-        self._data_chunk = None
-        self._postdata_chunk = None
-        while 1:
-            try:
-                chunk = Chunk(fp, bigendian=0)
-            except EOFError:
-                break
-            chunkname = chunk.getname()
-            if chunkname == b"fmt ":
-                self._fmt_chunk = chunk
-            elif chunkname == b"fact":
-                self._fact_chunk = chunk
-            elif chunkname == b"data":
-                if not self._fmt_chunk:
-                    raise Error("data chunk before fmt chunk")
-                self._data_chunk = chunk
-            elif self._data_chunk and self._fact_chunk:
-                # check whether a chunk is present after the data chunk to
-                # prevent appending data
-                self._postdata_chunk = chunk
-            chunk.skip()
-        if not self._fmt_chunk or not self._data_chunk:
-            raise Error("fmt and/or data chunk missing")
-
-        self._dtype = None
-        self._fmt_chunk.seek(0)
-        (
-            self._tag,
-            self._nchannels,
-            self._framerate,
-            _nAvgBytesPerSec,
-            _wBlockAlign,
-            bits,
-        ) = struct.unpack(b"<HHLLHH", self._fmt_chunk.read(16))
-        # load extended block if it's there
-        if self._tag == WAVE_FORMAT_EXTENSIBLE:
-            if self._fmt_chunk.chunksize < 16:
-                raise Error("extensible format but no format extension")
-            _cbSize, _wValidBits, _dwChannelMask, self._tag = struct.unpack(
-                b"<hhlH", self._fmt_chunk.read(10)
+    def _advance(self, nbytes: int):
+        """Updates the write position after nbytes of data have been written"""
+        self._write_pos += nbytes
+        self._bytes_written = max(self._bytes_written, self._write_pos)
+        if self._header_due("write"):
+            self.fp.flush()
+            self._write_sizes()
+
+    def _write_from(self, src: BinaryIO, offset: int, nbytes: int):
+        """Writes nbytes of encoded data, copied from offset in the file src.
+
+        The data are copied by the kernel if the platform supports it. Both
+        files must have file descriptors.
+        """
+        if self.mode == "r":
+            raise Error("file is read-only")
+        if self._postdata:
+            raise Error("cannot append to data chunk without overwriting other chunks")
+        self._check_size(nbytes)
+        tracer = _tracer
+        if tracer is not None:
+            start = time.perf_counter()
+        self.fp.flush()
+        pos = self._data_offset + self._write_pos
+        _copy_range(src, offset, self.fp, pos, nbytes)
+        # the data didn't go through the buffer, so its position is stale
+        self.fp.seek(pos + nbytes)
+        self._advance(nbytes)
+        if tracer is not None:
+            tracer("copy", nbytes, time.perf_counter() - start)
+
+    def _scratch(self, size: int) -> np.ndarray:
+        """Returns a reusable buffer with at least size elements of the file's dtype"""
+        buf = getattr(self, "_scratch_buf", None)
+        if buf is None or buf.size < size:
+            buf = self._scratch_buf = np.empty(size, dtype=self._dtype)
+        return buf
+
+    def _scratch_packed(self, size: int) -> np.ndarray:
+        """Returns a reusable buffer for at least size packed 24-bit samples"""
+        buf = getattr(self, "_scratch_packed_buf", None)
+        if buf is None or buf.shape[0] < size:
+            buf = self._scratch_packed_buf = np.empty((size, 3), dtype="B")
+        return buf
+
+    def _load_header(self, cache: "HeaderCache | None" = None):
+        """Reads metadata from header, or from cache if it's not None"""
+        tracer = _tracer
+        if tracer is not None:
+            start = time.perf_counter()
+        header = None if cache is None else cache.get(self.fp)
+        if header is None:
+            header = self._read_header()
+            if cache is not None:
+                cache.put(self.fp, header)
+        self._set_header(header)
+        if tracer is not None:
+            tracer("header", self._data_offset, time.perf_counter() - start)
+
+    def _read_header(self) -> dict:
+        """Parses the header of the file"""
+        # try to parse the header from a single read, which works unless
+        # there's a lot of metadata before the data chunk
+        self.fp.seek(0)
+        header = _parse_header(self.fp.read(_HEADER_PEEK))
+        if header is None:
+            self.fp.seek(0)
+            header = _walk_header(self.fp)
+        elif header["fact"]:
+            # check whether a chunk is present after the data chunk to
+            # prevent appending data
+            end = (
+                header["data_offset"] + header["data_size"] + (header["data_size"] & 1)
             )
-        if self._tag == WAVE_FORMAT_PCM:
-            # bit size is rounded up to the nearest multiple of 8; I'm
-            # not going to support any format that can't be easily
-            # mmap'd, i.e. files that have weird container sizes (like 24)
-            if bits <= 8:
-                self._dtype = dtype("B")
-            elif bits <= 16:
-                self._dtype = dtype("<h")
-            elif bits <= 24:
-                raise Error(f"unsupported bit depth: {bits}")
-            elif bits <= 32:
-                self._dtype = dtype("<i")
-            elif bits == 64:
-                self._dtype = dtype("<l")
-            else:
-                raise Error(f"unsupported bit depth: {bits}")
-        elif self._tag == WAVE_FORMAT_IEEE_FLOAT:
-            try:
-                self._dtype = dtype(f"float{bits}")
-            except TypeError as err:
-                raise Error(f"unsupported bit depth for IEEE floats: {bits}") from err
-        else:
-            raise Error(f"unsupported format: {self._tag}")
-        self._data_offset = self._data_chunk.offset + 8
+            if end + 8 <= header["riff_end"]:
+                self.fp.seek(end)
+                header["postdata"] = len(self.fp.read(8)) == 8
+        return header
+
+    def _set_header(self, header: dict):
+        """Sets properties from the output of _parse_header or _walk_header"""
+        self._tag = header["tag"]
+        self._nchannels = header["nchannels"]
+        self._framerate = header["framerate"]
+        self._dtype = header["dtype"]
+        self._sampwidth = header["sampwidth"]
+        self._data_offset = header["data_offset"]
+        self._data_size = header["data_size"]
+        self._ds64_offset = header["ds64_offset"]
+        self._rf64 = header["rf64"]
+        self._postdata = header["postdata"]
         if self.mode == "r+":
             self.fp.seek(0, 2)
-            self._bytes_written = self.fp.tell() - self._data_offset
+            self._bytes_written = self._write_pos = self.fp.tell() - self._data_offset
+            self._header_bytes = self._data_size
+            self._header_time = time.monotonic()
 
     @classmethod
     def _file_format(cls, dtype):
@@ -347,10 +1277,15 @@ class wavfile:
 
         # main chunk
         out = struct.pack(b"<4sl4s", b"RIFF", 0, b"WAVE")
+        # reserve space for a ds64 chunk in case the file grows past 4 GiB
+        self._rf64 = False
+        self._postdata = False
+        self._ds64_offset = len(out)
+        out += struct.pack(b"<4sl28s", b"JUNK", 28, b"")
         # fmt chunk
         tag = etag = self._file_format(self._dtype)
         fmt_size = 16
-        if self._dtype.itemsize > 2 or self._nchannels > 2:
+        if self._sampwidth > 2 or self._nchannels > 2:
             fmt_size = 40
             tag = WAVE_FORMAT_EXTENSIBLE
 
@@ -361,18 +1296,20 @@ class wavfile:
             tag,
             self._nchannels,
             self._framerate,
-            self._nchannels * self._framerate * self._dtype.itemsize,
-            self._nchannels * self._dtype.itemsize,
-            self._dtype.itemsize * 8,
+            self._nchannels * self._framerate * self._sampwidth,
+            self._nchannels * self._sampwidth,
+            self._sampwidth * 8,
         )
 
         if tag == WAVE_FORMAT_EXTENSIBLE:
             out += struct.pack(
-                b"<HHlH14s",
+                b"<HHLH14s",
                 22,
-                self._dtype.itemsize * 8,
-                # use the full bitdepth
-                (1 << self._nchannels) - 1,
+                self._sampwidth * 8,
+                # use the full bitdepth. The channel mask only has room for
+                # 32 channels, so it's left empty (no speaker assignments) if
+                # there are more
+                (1 << self._nchannels) - 1 if self._nchannels <= 32 else 0,
                 etag,
                 b"\x00\x00\x00\x00\x10\x00\x80\x00\x00\xaa\x008\x9b\x71",
             )
@@ -388,56 +1325,2404 @@ class wavfile:
 
         self.fp.seek(0)
         self.fp.write(out)
+        # sizes are updated with pwrite, which bypasses the buffer
+        self.fp.flush()
         self._data_offset = self.fp.tell()
-        self._bytes_written = 0
+        self._bytes_written = self._write_pos = self._header_bytes = 0
+        self._header_time = time.monotonic()
 
 
 open = wavfile
 
 
-def rescale(data: npt.ArrayLike, tgt_dtype: npt.DTypeLike) -> np.ndarray:
+class WaveArray:
+    """A read-only, array-like view of the data in a wavfile, rescaled to dtype.
+
+    Indexing works like indexing the array returned by wavfile.read(), with
+    frames along the first axis and channels along the second (if there's more
+    than one channel), but only the requested data are read and rescaled. The
+    object has shape, dtype, and ndim attributes and can be converted with
+    np.asarray(), so it can be used with libraries that load chunks of
+    array-like objects on demand (e.g., dask.array.from_array).
+
+    Get one using wavfile.as_array(). The shape follows the file if it grows.
+    """
+
+    def __init__(self, fp: wavfile, dtype: npt.DTypeLike = "float32"):
+        self.fp = fp
+        self.dtype = np.dtype(dtype)
+        fp._file_format(self.dtype)
+
+    @property
+    def shape(self) -> tuple[int, ...]:
+        if self.fp.nchannels == 1:
+            return (self.fp.nframes,)
+        return (self.fp.nframes, self.fp.nchannels)
+
+    @property
+    def ndim(self) -> int:
+        return len(self.shape)
+
+    @property
+    def size(self) -> int:
+        return self.fp.nframes * self.fp.nchannels
+
+    def __len__(self) -> int:
+        return self.fp.nframes
+
+    def __repr__(self) -> str:
+        return f"<{self.__class__.__module__}.{self.__class__.__name__} of '{self.fp.filename}', shape {self.shape}, dtype '{self.dtype}'>"
+
+    def astype(self, dtype: npt.DTypeLike) -> "WaveArray":
+        """Returns a view of the same file with a different dtype"""
+        return self.__class__(self.fp, dtype)
+
+    def __array__(self, dtype: npt.DTypeLike | None = None, copy: bool | None = None):
+        A = self[...]
+        if dtype is not None:
+            A = A.astype(dtype, copy=False)
+        return A.copy() if copy else A
+
+    def __getitem__(self, key) -> np.ndarray:
+        import operator
+
+        key = key if isinstance(key, tuple) else (key,)
+        for i, k in enumerate(key):
+            if k is Ellipsis:
+                fill = (slice(None),) * (self.ndim - len(key) + 1)
+                key = key[:i] + fill + key[i + 1 :]
+                break
+        if len(key) > self.ndim:
+            raise IndexError(f"too many indices for array with {self.ndim} dimensions")
+        frames, channels = (key[0], key[1:]) if key else (slice(None), ())
+        nframes = self.fp.nframes
+        # find the range of frames to read and where the selection is in it
+        if isinstance(frames, slice):
+            selected = range(*frames.indices(nframes))
+            if len(selected) == 0:
+                start = stop = 0
+            else:
+                start = min(selected[0], selected[-1])
+                stop = max(selected[0], selected[-1]) + 1
+            local = slice(selected.start - start, None, selected.step)
+        elif isinstance(frames, (list, np.ndarray)):
+            frames = np.asarray(frames)
+            if frames.dtype == bool:
+                (frames,) = frames.nonzero()
+            frames = np.where(frames < 0, frames + nframes, frames)
+            if ((frames < 0) | (frames >= nframes)).any():
+                raise IndexError("frame index out of range")
+            start = frames.min(initial=0)
+            stop = frames.max(initial=-1) + 1
+            local = frames - start
+        else:
+            frame = operator.index(frames)
+            if frame < 0:
+                frame += nframes
+            if not 0 <= frame < nframes:
+                raise IndexError(f"frame {frames} out of range")
+            start, stop, local = frame, frame + 1, 0
+        A = self.fp.read(stop - start, start, memmap="r")[(local, *channels)]
+        A = rescale(A, self.dtype)
+        return A[()] if A.ndim == 0 else A
+
+
+class AsyncWriter:
+    """Writes data to a wavfile from a background thread.
+
+    Calls to write() copy the data into a ring of preallocated blocks and
+    return; a dedicated thread rescales the blocks and writes them to disk, so
+    that the caller (e.g. an acquisition callback) isn't blocked by disk stalls.
+    The header is updated periodically by the writer thread rather than after
+    every write.
+
+    fp:              an open wavfile. It should not be used by any other
+                     thread until the writer is closed.
+    blocksize:       the number of frames in each block
+    nblocks:         the number of blocks in the ring
+    dtype:           the type of the blocks. Data are rescaled to this type when
+                     they're copied, and then to the type of the file by the
+                     writer thread. Defaults to the smallest floating point
+                     type that can hold the file's samples (float32 for 16-bit
+                     files), so the conversion to an integer type is done by
+                     the writer thread.
+    overflow:        what to do when all the blocks are full. 'block' waits
+                     for a block to be written; 'drop' discards the data (the
+                     number of dropped frames is in stats); 'grow' allocates a
+                     new block.
+    header_interval: the minimum time (in s) between header updates, or None
+                     to update the header only when the writer is closed
+
+    The writer may be used as a context manager, and will be closed when the
+    context exits. Closing the writer waits for all the data to be written but
+    does not close fp.
+    """
+
+    def __init__(
+        self,
+        fp: wavfile,
+        blocksize: int = 4096,
+        nblocks: int = 64,
+        dtype: npt.DTypeLike | None = None,
+        overflow: str = "block",
+        header_interval: float | None = 1.0,
+    ):
+        import queue
+
+        if overflow not in ("block", "drop", "grow"):
+            raise ValueError("Invalid overflow policy (use 'block', 'drop', 'grow')")
+        if fp.mode == "r":
+            raise Error("file is read-only")
+        self.fp = fp
+        self.overflow = overflow
+        self.header_interval = header_interval
+        if dtype is None:
+            dtype = np.promote_types(fp.dtype, "f")
+        self.dtype = np.dtype(dtype)
+        if fp.nchannels > 1:
+            self._shape = (blocksize, fp.nchannels)
+        else:
+            self._shape = (blocksize,)
+        self._blocks = [np.empty(self._shape, dtype=self.dtype) for _ in range(nblocks)]
+        self._free = queue.SimpleQueue()
+        for i in range(nblocks):
+            self._free.put(i)
+        self._filled = queue.Queue()
+        self._error = None
+        self._frames_written = 0
+        self._frames_dropped = 0
+        self._max_queue_depth = 0
+        self._max_enqueue_latency = 0.0
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    @property
+    def stats(self) -> dict:
+        """Statistics about the state and history of the writer"""
+        return {
+            "queue_depth": self._filled.qsize(),
+            "max_queue_depth": self._max_queue_depth,
+            "max_enqueue_latency": self._max_enqueue_latency,
+            "nblocks": len(self._blocks),
+            "frames_written": self._frames_written,
+            "frames_dropped": self._frames_dropped,
+        }
+
+    def _get_block(self) -> int | None:
+        """Returns the index of a free block, or None if the data should be dropped"""
+        import queue
+
+        if self.overflow == "block":
+            return self._free.get()
+        try:
+            return self._free.get_nowait()
+        except queue.Empty:
+            if self.overflow == "drop":
+                return None
+            self._blocks.append(np.empty(self._shape, dtype=self.dtype))
+            return len(self._blocks) - 1
+
+    def write(self, data: npt.ArrayLike):
+        """Queues data to be written. Returns without waiting for the data to be
+        written unless overflow is 'block' and there are no free blocks."""
+        start = time.perf_counter()
+        if self._error is not None:
+            raise Error("writer thread failed") from self._error
+        if not self._thread.is_alive():
+            raise Error("writer is closed")
+        data = np.asarray(data).reshape(-1, *self._shape[1:])
+        blocksize = self._shape[0]
+        for i in range(0, data.shape[0], blocksize):
+            chunk = data[i : i + blocksize]
+            idx = self._get_block()
+            if idx is None:
+                self._frames_dropped += chunk.shape[0]
+                continue
+            rescale(chunk, self.dtype, out=self._blocks[idx][: chunk.shape[0]])
+            self._filled.put((idx, chunk.shape[0]))
+        self._max_queue_depth = max(self._max_queue_depth, self._filled.qsize())
+        self._max_enqueue_latency = max(
+            self._max_enqueue_latency, time.perf_counter() - start
+        )
+        return self
+
+    def _run(self):
+        """Writes queued blocks to the file"""
+        import queue
+
+        last_update = time.monotonic()
+        while True:
+            timeout = None
+            if self.header_interval is not None:
+                timeout = max(0, last_update + self.header_interval - time.monotonic())
+            try:
+                item = self._filled.get(timeout=timeout)
+            except queue.Empty:
+                item = ()
+            if item is None:
+                break
+            try:
+                if item and self._error is None:
+                    idx, nframes = item
+                    self.fp.write(self._blocks[idx][:nframes])
+                    self._frames_written += nframes
+                if (
+                    self.header_interval is not None
+                    and self._error is None
+                    and time.monotonic() - last_update >= self.header_interval
+                ):
+                    self.fp.flush()
+                    last_update = time.monotonic()
+            except Exception as err:
+                # the error is raised in the caller's thread
+                self._error = err
+            if item:
+                self._free.put(item[0])
+
+    def close(self):
+        """Waits for the queued data to be written and updates the header"""
+        if self._thread.is_alive():
+            self._filled.put(None)
+            self._thread.join()
+            if self._error is None:
+                self.fp.flush()
+        if self._error is not None:
+            raise Error("writer thread failed") from self._error
+
+
+class HeaderCache:
+    """A persistent cache of parsed WAVE headers, stored in an SQLite database.
+
+    Entries are keyed by the absolute path of the file, and are only used if
+    the modification time and size of the file haven't changed since the header
+    was stored. Pass an instance to wavfile (or open) using the header_cache
+    argument. The cache can be shared by multiple threads and processes.
+
+    path:   the location of the database. The default is an in-memory database
+            that is discarded when the cache is closed.
+    """
+
+    _fields = (
+        "tag",
+        "nchannels",
+        "framerate",
+        "dtype",
+        "sampwidth",
+        "data_offset",
+        "data_size",
+        "ds64_offset",
+        "rf64",
+        "fact",
+        "postdata",
+        "riff_end",
+    )
+
+    def __init__(self, path: str | Path = ":memory:"):
+        import sqlite3
+
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(str(path), check_same_thread=False)
+        with self._lock, self._db:
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute("PRAGMA synchronous=NORMAL")
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS headers (path TEXT PRIMARY KEY, "
+                "mtime_ns INTEGER, size INTEGER, " + ", ".join(self._fields) + ")"
+            )
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._db.execute("SELECT COUNT(*) FROM headers").fetchone()[0]
+
+    def close(self):
+        """Closes the database"""
+        self._db.close()
+
+    @staticmethod
+    def _key(fp: BinaryIO) -> tuple[str, int, int] | None:
+        """Returns the key for fp, or None if it's not a file on disk"""
+        import os
+
+        try:
+            st = os.fstat(fp.fileno())
+            return os.path.abspath(fp.name), st.st_mtime_ns, st.st_size
+        except (AttributeError, OSError, TypeError):
+            return None
+
+    def get(self, fp: BinaryIO) -> dict | None:
+        """Returns the cached header for the open file fp, or None on a miss"""
+        key = self._key(fp)
+        if key is None:
+            return None
+        with self._lock:
+            row = self._db.execute(
+                "SELECT * FROM headers WHERE path = ? AND mtime_ns = ? AND size = ?",
+                key,
+            ).fetchone()
+        if row is None:
+            return None
+        header = dict(zip(self._fields, row[3:], strict=True))
+        header["dtype"] = np.dtype(header["dtype"])
+        header["rf64"] = bool(header["rf64"])
+        header["fact"] = bool(header["fact"])
+        header["postdata"] = bool(header["postdata"])
+        return header
+
+    def put(self, fp: BinaryIO, header: dict):
+        """Stores the header for the open file fp"""
+        key = self._key(fp)
+        if key is None:
+            return
+        values = [header[field] for field in self._fields]
+        values[self._fields.index("dtype")] = header["dtype"].str
+        with self._lock, self._db:
+            self._db.execute(
+                f"INSERT OR REPLACE INTO headers VALUES ({', '.join('?' * (len(values) + 3))})",
+                (*key, *values),
+            )
+
+
+class MappingPool:
+    """A pool of open, memory-mapped WAVE files with least-recently-used eviction.
+
+    Use this to read from many files without keeping all of them open. Files
+    are opened in 'r' mode when they are first used, and the least recently
+    used file is closed when more than maxfiles are open, which limits the
+    number of file descriptors and mappings. Arrays that have already been
+    returned stay valid after their file is closed. The pool can be used from
+    multiple threads.
+
+    maxfiles:  the maximum number of files to keep open
+
+    Use MappingPool.shared() to get a pool that is shared by the whole process.
+    """
+
+    _shared = None
+    _shared_lock = threading.Lock()
+
+    def __init__(self, maxfiles: int = 256):
+        from collections import OrderedDict
+
+        if maxfiles < 1:
+            raise ValueError("maxfiles must be positive")
+        self.maxfiles = maxfiles
+        self._files: OrderedDict[str, wavfile] = OrderedDict()
+        self._lock = threading.Lock()
+
+    @classmethod
+    def shared(cls) -> "MappingPool":
+        """Returns the process-wide pool, creating it if needed"""
+        if cls._shared is None:
+            with cls._shared_lock:
+                if cls._shared is None:
+                    cls._shared = cls()
+        return cls._shared
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def __len__(self) -> int:
+        return len(self._files)
+
+    def __contains__(self, path: str | Path) -> bool:
+        import os
+
+        return os.path.abspath(path) in self._files
+
+    def _get(self, path: str | Path) -> tuple[str, wavfile]:
+        import os
+
+        key = os.path.abspath(path)
+        with self._lock:
+            fp = self._files.get(key)
+            if fp is not None:
+                self._files.move_to_end(key)
+                return key, fp
+        # opening, parsing, and mapping the file are done without the lock so
+        # that other threads can use the files that are already open
+        fp = wavfile(key, "r")
+        try:
+            if fp.nframes > 0:
+                fp._map(0)
+        except BaseException:
+            fp.__del__()
+            raise
+        closing = []
+        with self._lock:
+            if key in self._files:
+                # another thread opened the file first
+                closing.append(fp)
+                fp = self._files[key]
+                self._files.move_to_end(key)
+            else:
+                self._files[key] = fp
+                while len(self._files) > self.maxfiles:
+                    closing.append(self._files.popitem(last=False)[1])
+        for old in closing:
+            old.__del__()
+        return key, fp
+
+    def open(self, path: str | Path) -> wavfile:
+        """Returns the open wavfile for path.
+
+        The file may be closed by the pool if other files are used later. Use
+        read() to get data that stay valid.
+        """
+        return self._get(path)[1]
+
+    def read(
+        self, path: str | Path, frames: int | None = None, offset: int = 0
+    ) -> np.ndarray:
+        """Returns a read-only view of data in path, as wavfile.read(memmap='r')"""
+        while True:
+            key, fp = self._get(path)
+            with self._lock:
+                # the file is already mapped, so this only slices the mapping.
+                # If it was evicted in the meantime, it may be closed.
+                if self._files.get(key) is fp:
+                    return fp.read(frames, offset, memmap="r")
+
+    def close(self):
+        """Closes all the files in the pool"""
+        with self._lock:
+            while self._files:
+                _, fp = self._files.popitem()
+                fp.__del__()
+
+
+class Corpus:
+    """A sequence of WAVE files that are treated as one long signal.
+
+    The number of frames in each file is found with scan() when the corpus is
+    created, and an index of where each file starts is built from them. The
+    index can be saved with save() and loaded with Corpus.load() to avoid
+    scanning the files again. Files are opened when their data are first
+    needed, through a MappingPool that limits how many are kept open.
+
+    Indexing and slicing are by frame, as if the files had been concatenated,
+    so corpus[a:b] is the same as corpus.read(b - a, a). Data that come from
+    a single file are read-only views of its memmap (unless they have to be
+    converted to dtype), and data that span files are copied into a new array.
+
+    paths:    the files, in order
+    dtype:    if not None, data are rescaled to this type. Required if the
+              files don't all use the same storage type.
+    pool:     the MappingPool used to open the files. If None, the corpus
+              creates its own, which is closed when the corpus is closed.
+    workers:  the maximum number of threads to use for scanning the files
+
+    All the files must have the same sampling rate and number of channels.
+    """
+
+    def __init__(
+        self,
+        paths: Iterable[str | Path],
+        dtype: npt.DTypeLike | None = None,
+        pool: MappingPool | None = None,
+        workers: int | None = None,
+    ):
+        paths = [str(path) for path in paths]
+        self._set_index(paths, scan(paths, workers), dtype, pool)
+
+    def _set_index(
+        self,
+        paths: list[str],
+        info: np.ndarray,
+        dtype: npt.DTypeLike | None,
+        pool: MappingPool | None,
+    ):
+        if len(paths) == 0:
+            raise Error("corpus must have at least one file")
+        for field in ("sampling_rate", "nchannels"):
+            if (info[field] != info[field][0]).any():
+                raise Error(f"files in corpus have different values for {field}")
+        if dtype is None:
+            if (info["dtype"] != info["dtype"][0]).any():
+                raise Error("files in corpus have different storage types; set dtype")
+            dtype = info["dtype"][0]
+        self.paths = paths
+        self._info = info
+        self._dtype = np.dtype(dtype)
+        self.offsets = np.zeros(len(paths) + 1, dtype="i8")
+        np.cumsum(info["nframes"], out=self.offsets[1:])
+        self._own_pool = pool is None
+        self._pool = MappingPool() if pool is None else pool
+
+    @classmethod
+    def load(
+        cls,
+        file: str | Path | BinaryIO,
+        dtype: npt.DTypeLike | None = None,
+        pool: MappingPool | None = None,
+    ) -> "Corpus":
+        """Loads a corpus from an index written by save(). The files are not
+        checked until they're read."""
+        self = cls.__new__(cls)
+        with np.load(file) as index:
+            self._set_index(index["paths"].tolist(), index["info"], dtype, pool)
+        return self
+
+    def save(self, file: str | Path | BinaryIO):
+        """Saves the index of the corpus in numpy's .npz format"""
+        np.savez(file, paths=np.asarray(self.paths, dtype=str), info=self._info)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def close(self):
+        """Closes the files opened by the corpus, if it created the pool"""
+        if self._own_pool:
+            self._pool.close()
+
+    def __len__(self) -> int:
+        return int(self.offsets[-1])
+
+    def __repr__(self) -> str:
+        return f"<{self.__class__.__module__}.{self.__class__.__name__} with {len(self.paths)} files, {len(self)} frames, sampling rate {self.sampling_rate}>"
+
+    @property
+    def sampling_rate(self) -> int:
+        return int(self._info["sampling_rate"][0])
+
+    @property
+    def nchannels(self) -> int:
+        return int(self._info["nchannels"][0])
+
+    @property
+    def nframes(self) -> int:
+        return len(self)
+
+    @property
+    def dtype(self) -> np.dtype:
+        """The type of the data returned by read()"""
+        return self._dtype
+
+    def locate(self, frame: npt.ArrayLike) -> tuple[np.ndarray, np.ndarray]:
+        """Returns the index of the file (in paths) that contains each frame,
+        and the position of the frame within that file"""
+        frame = np.asarray(frame)
+        if ((frame < 0) | (frame >= len(self))).any():
+            raise IndexError("frame out of range")
+        index = np.searchsorted(self.offsets, frame, side="right") - 1
+        return index, frame - self.offsets[index]
+
+    def __getitem__(self, key: int | slice) -> np.ndarray:
+        if isinstance(key, slice):
+            start, stop, step = key.indices(len(self))
+            if step == 1:
+                return self.read(max(stop - start, 0), start)
+            frames = np.arange(start, stop, step)
+            if frames.size == 0:
+                return self.read(0)
+            index, local = self.locate(frames)
+            out = np.empty((frames.size, *self._frame_shape), dtype=self._dtype)
+            # the frames are in order, so each file's frames are a run in out
+            bounds = np.flatnonzero(np.diff(index)) + 1
+            for lo, hi in zip(
+                np.r_[0, bounds], np.r_[bounds, frames.size], strict=True
+            ):
+                pos = local[lo:hi]
+                first = pos.min()
+                data = self._read_raw(index[lo], pos.max() + 1 - first, first)
+                rescale(data[pos - first], self._dtype, out=out[lo:hi])
+            return out
+        import operator
+
+        frame = operator.index(key)
+        if frame < 0:
+            frame += len(self)
+        index, local = self.locate(frame)
+        return self._read_file(int(index), 1, int(local))[0]
+
+    def read(self, frames: int | None = None, offset: int = 0) -> np.ndarray:
+        """Returns frames of data starting at offset, as in wavfile.read()"""
+        if offset < 0:
+            raise IndexError("offset must not be negative")
+        stop = len(self) if frames is None else min(offset + frames, len(self))
+        if stop <= offset:
+            return self._read_file(0, 0, 0)
+        first = np.searchsorted(self.offsets, offset, side="right") - 1
+        last = np.searchsorted(self.offsets, stop - 1, side="right") - 1
+        if first == last:
+            return self._read_file(first, stop - offset, offset - self.offsets[first])
+        out = np.empty((stop - offset, *self._frame_shape), dtype=self._dtype)
+        for i in range(first, last + 1):
+            lo = max(offset, self.offsets[i])
+            hi = min(stop, self.offsets[i + 1])
+            if hi > lo:
+                data = self._read_raw(i, hi - lo, lo - self.offsets[i])
+                rescale(data, self._dtype, out=out[lo - offset : hi - offset])
+        return out
+
+    @property
+    def _frame_shape(self) -> tuple[int, ...]:
+        return () if self.nchannels == 1 else (self.nchannels,)
+
+    def _read_file(self, index: int, frames: int, offset: int) -> np.ndarray:
+        return rescale(self._read_raw(index, frames, offset), self._dtype)
+
+    def _read_raw(self, index: int, frames: int, offset: int) -> np.ndarray:
+        """Reads from one file, checking that it still matches the index"""
+        path = self.paths[index]
+        try:
+            data = self._pool.read(path, int(frames), int(offset))
+        except ValueError:
+            # mmap fails if the file is shorter than the index says
+            data = None
+        if data is None or data.shape[0] != frames:
+            raise Error(f"{path} has changed since the corpus was indexed")
+        return data
+
+
+class Envelope:
+    """A multi-resolution min/max/RMS summary of a WAVE file, for drawing
+    waveform overviews at any zoom level without reading every sample.
+
+    levels[0] has one bin for every binsize frames, and each level after it
+    has one bin for every factor bins of the level before, down to a single
+    bin. Each level is a structured array with shape (bins, channels) and
+    fields 'min', 'max', and 'rms', with values rescaled to floats (as in
+    rescale()). The last bin of each level may cover fewer frames.
+
+    Get one from wavfile.envelope() or build_peaks(). Envelopes can be saved
+    with save() and loaded with Envelope.load().
+    """
+
+    dtype = np.dtype([("min", "f4"), ("max", "f4"), ("rms", "f4")])
+
+    def __init__(
+        self,
+        levels: list[np.ndarray],
+        binsize: int,
+        factor: int,
+        nframes: int,
+        sampling_rate: int,
+    ):
+        self.levels = levels
+        self.binsize = binsize
+        self.factor = factor
+        self.nframes = nframes
+        self.sampling_rate = sampling_rate
+
+    def __len__(self) -> int:
+        return len(self.levels)
+
+    def __getitem__(self, level: int) -> np.ndarray:
+        return self.levels[level]
+
+    def __repr__(self) -> str:
+        return f"<{self.__class__.__module__}.{self.__class__.__name__} with {len(self)} levels, {self.nframes} frames, binsize {self.binsize}>"
+
+    def frames_per_bin(self, level: int) -> int:
+        """The number of frames summarized by each bin in level"""
+        return self.binsize * self.factor ** range(len(self.levels))[level]
+
+    def select(
+        self, width: int, offset: int = 0, frames: int | None = None
+    ) -> tuple[np.ndarray, int]:
+        """Returns the bins for drawing frames of data starting at offset.
+
+        The bins come from the coarsest level that still has at least width
+        bins in the range (or from the finest level, if none does), so the
+        number of values read is proportional to width, not frames.
+
+        Returns (bins, frames per bin). The first bin starts at or before
+        offset, at a multiple of frames per bin.
+        """
+        if frames is None:
+            frames = self.nframes - offset
+        level = 0
+        while (
+            level + 1 < len(self.levels)
+            and frames // self.frames_per_bin(level + 1) >= width
+        ):
+            level += 1
+        size = self.frames_per_bin(level)
+        start = max(offset, 0) // size
+        stop = -(-(offset + frames) // size)
+        return self.levels[level][start:stop], size
+
+    def save(self, file: str | Path | BinaryIO, **keys):
+        """Saves the envelope in numpy's .npz format. Any keyword arguments are
+        stored with it (e.g., to check whether it's still valid)."""
+        arrays = {f"level{i}": level for i, level in enumerate(self.levels)}
+        np.savez(
+            file,
+            binsize=self.binsize,
+            factor=self.factor,
+            nframes=self.nframes,
+            sampling_rate=self.sampling_rate,
+            **keys,
+            **arrays,
+        )
+
+    @classmethod
+    def load(cls, file: str | Path | BinaryIO) -> "Envelope":
+        """Loads an envelope written by save()"""
+        with np.load(file) as data:
+            return cls._from_npz(data)
+
+    @classmethod
+    def _from_npz(cls, data) -> "Envelope":
+        """Builds an envelope from the arrays in an opened .npz file"""
+        nlevels = sum(1 for name in data.files if name.startswith("level"))
+        return cls(
+            [data[f"level{i}"] for i in range(nlevels)],
+            int(data["binsize"]),
+            int(data["factor"]),
+            int(data["nframes"]),
+            int(data["sampling_rate"]),
+        )
+
+
+class SharedData:
+    """The data of a WAVE file in a named block of shared memory.
+
+    The data are in the data attribute, an array with the same shape as the
+    one returned by wavfile.read(). Create a block with wavfile.share(). To
+    use it in another process, pass the SharedData object (it's pickled as
+    the name and format of the block), or call SharedData.attach() with the
+    same values. Attaching maps the block without copying it.
+
+    The object may be used as a context manager, and will be closed when the
+    context exits. The process that created the block should call unlink()
+    when all processes are done with it. The block can't be closed while
+    there are other references to data.
+    """
+
+    def __init__(
+        self, shm, shape: tuple[int, ...], dtype: np.dtype, sampling_rate: int
+    ):
+        self.shm = shm
+        self.sampling_rate = sampling_rate
+        self.data = np.ndarray(shape, dtype=dtype, buffer=shm.buf)
+
+    @classmethod
+    def create(
+        cls,
+        fp: wavfile,
+        dtype: npt.DTypeLike | None = None,
+        name: str | None = None,
+    ) -> "SharedData":
+        """Creates a block of shared memory with the data from fp"""
+        from multiprocessing import shared_memory
+
+        dtype = np.dtype(fp.dtype if dtype is None else dtype)
+        shape = (fp.nframes, fp.nchannels) if fp.nchannels > 1 else (fp.nframes,)
+        nbytes = fp.nframes * fp.nchannels * dtype.itemsize
+        shm = shared_memory.SharedMemory(name, create=True, size=max(1, nbytes))
+        self = cls(shm, shape, dtype, fp.sampling_rate)
+        try:
+            fp.read(out=self.data)
+        except BaseException:
+            self.close()
+            self.unlink()
+            raise
+        return self
+
+    @classmethod
+    def attach(
+        cls,
+        name: str,
+        shape: tuple[int, ...],
+        dtype: npt.DTypeLike,
+        sampling_rate: int,
+    ) -> "SharedData":
+        """Attaches to an existing block of shared memory"""
+        from multiprocessing import shared_memory
+
+        try:
+            # only the creator should unlink the block when it exits
+            shm = shared_memory.SharedMemory(name, track=False)
+        except TypeError:
+            # python < 3.13
+            shm = shared_memory.SharedMemory(name)
+        return cls(shm, tuple(shape), np.dtype(dtype), sampling_rate)
+
+    def __reduce__(self):
+        return (
+            self.attach,
+            (self.name, self.data.shape, self.data.dtype.str, self.sampling_rate),
+        )
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def __repr__(self) -> str:
+        return f"<{self.__class__.__module__}.{self.__class__.__name__} '{self.name}', shape {self.data.shape}, dtype '{self.data.dtype}'>"
+
+    @property
+    def name(self) -> str:
+        return self.shm.name
+
+    def close(self):
+        """Detaches from the block of shared memory"""
+        self.data = None
+        self.shm.close()
+
+    def unlink(self):
+        """Requests that the block be destroyed once every process has closed it"""
+        self.shm.unlink()
+
+
+class AsyncWavfile:
+    """A wavfile for use with asyncio. Get one with aopen().
+
+    Opening, reading, and writing are done by a bounded pool of threads, so
+    that parsing headers and page faults on slow storage don't block the
+    event loop. Data returned by read() and iter_blocks() are copied out of
+    the mapping by the pool, so they are already in memory.
+
+    Files opened in 'r' mode by path are shared: concurrent calls to aopen()
+    for the same file use one wavfile, which is closed when the last
+    AsyncWavfile using it is closed, and concurrent reads of the same range
+    are done once and return the same (read-only) array. Files are assumed
+    not to change while they're open.
+
+    The object may be used as an async context manager, and will be closed
+    when the context exits.
+    """
+
+    def __init__(self, handle: "_AsyncHandle", fp: wavfile):
+        import asyncio
+
+        self.fp = fp
+        self._handle = handle
+        self._write_lock = asyncio.Lock()
+        self._closed = False
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        await self.close()
+
+    def __repr__(self) -> str:
+        return f"<{self.__class__.__module__}.{self.__class__.__name__} '{self.filename}', mode '{self.mode}', dtype '{self.dtype}', sampling rate {self.sampling_rate}>"
+
+    @property
+    def filename(self) -> str:
+        return self.fp.filename
+
+    @property
+    def mode(self) -> str:
+        return self.fp.mode
+
+    @property
+    def sampling_rate(self) -> int:
+        return self.fp.sampling_rate
+
+    @property
+    def nchannels(self) -> int:
+        return self.fp.nchannels
+
+    @property
+    def nframes(self) -> int:
+        return self.fp.nframes
+
+    @property
+    def dtype(self) -> np.dtype:
+        return self.fp.dtype
+
+    async def _run(self, func: Callable, *args, **kwargs):
+        import asyncio
+        import functools
+
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(
+            self._handle.executor, functools.partial(func, *args, **kwargs)
+        )
+
+    async def read(
+        self,
+        frames: int | None = None,
+        offset: int = 0,
+        channels: int | slice | Iterable[int] | None = None,
+    ) -> np.ndarray:
+        """Returns a read-only array with data from the file, as wavfile.read()"""
+        import asyncio
+
+        if self._closed:
+            raise Error("file is closed")
+
+        def read():
+            A = np.array(self.fp.read(frames, offset, memmap="r", channels=channels))
+            A.flags.writeable = False
+            return A
+
+        if self.mode != "r":
+            async with self._write_lock:
+                return await self._run(read)
+        future = self._handle.submit((frames, offset, repr(channels)), read)
+        # one caller being cancelled shouldn't cancel the read for the others
+        return await asyncio.shield(asyncio.wrap_future(future))
+
+    async def iter_blocks(
+        self,
+        blocksize: int,
+        overlap: int = 0,
+        offset: int = 0,
+        frames: int | None = None,
+        dtype: npt.DTypeLike | None = None,
+    ) -> AsyncIterator[np.ndarray]:
+        """Asynchronously iterates through the data in blocks.
+
+        Arguments are the same as wavfile.iter_blocks(), but each block is a
+        new array, so it can be kept after the next iteration.
+        """
+        blocks = self.fp.iter_blocks(blocksize, overlap, offset, frames, dtype)
+
+        def next_block():
+            block = next(blocks, None)
+            return None if block is None else np.array(block)
+
+        while True:
+            block = await self._run(next_block)
+            if block is None:
+                return
+            yield block
+
+    async def write(
+        self, data: npt.ArrayLike, scale: bool = True, layout: str = "interleaved"
+    ):
+        """Writes data to the file, as wavfile.write(). Data must not be
+        modified until this returns. Concurrent writes are done in the order
+        they were called."""
+        if self._closed:
+            raise Error("file is closed")
+        async with self._write_lock:
+            await self._run(self.fp.write, data, scale, layout)
+        return self
+
+    async def flush(self):
+        """Flushes data to disk, as wavfile.flush()"""
+        async with self._write_lock:
+            await self._run(self.fp.flush)
+        return self
+
+    async def close(self):
+        """Closes the file, unless it's still being used by other coroutines"""
+        if self._closed:
+            return
+        self._closed = True
+        async with self._write_lock:
+            await self._run(self._handle.release)
+
+
+class _AsyncHandle:
+    """A wavfile being opened or used by one or more AsyncWavfiles"""
+
+    def __init__(self, future, executor, key: str | None = None):
+        self.future = future
+        self.executor = executor
+        self.key = key
+        self.users = 1
+        self._lock = threading.RLock()
+        self._inflight = {}
+
+    def submit(self, key, func: Callable):
+        """Runs func in the executor unless a call with the same key is
+        already running. Returns a concurrent.futures.Future."""
+        with self._lock:
+            future = self._inflight.get(key)
+            if future is None:
+                future = self._inflight[key] = self.executor.submit(func)
+                future.add_done_callback(lambda f: self._done(key, f))
+        return future
+
+    def _done(self, key, future):
+        with self._lock:
+            if self._inflight.get(key) is future:
+                del self._inflight[key]
+
+    def release(self):
+        """Removes a user, closing the file if there are no more"""
+        with _aio_lock:
+            self.users -= 1
+            if self.users > 0:
+                return
+            if self.key is not None and _aio_handles.get(self.key) is self:
+                del _aio_handles[self.key]
+        if self.future.done() and self.future.exception() is None:
+            self.future.result().__del__()
+
+
+def _aio_executor():
+    """Returns the default executor used by aopen(), creating it if needed"""
+    global _aio_default_executor
+    from concurrent.futures import ThreadPoolExecutor
+
+    with _aio_lock:
+        if _aio_default_executor is None:
+            _aio_default_executor = ThreadPoolExecutor(
+                _AIO_WORKERS, thread_name_prefix="ewave-aio"
+            )
+        return _aio_default_executor
+
+
+async def aopen(
+    file: str | Path | BinaryIO, mode: str = "r", executor=None, **kwargs
+) -> AsyncWavfile:
+    """Opens a WAVE file without blocking the event loop.
+
+    - file, mode: as for wavfile. Paths opened in 'r' mode are shared with
+      other AsyncWavfiles (see AsyncWavfile).
+    - executor: the concurrent.futures.Executor used to do the work. The
+      default is a pool of threads shared by all the files opened with aopen().
+    - additional keyword arguments are passed to wavfile. They are ignored if
+      the file is already open.
+    """
+    import asyncio
+    import os
+
+    if executor is None:
+        executor = _aio_executor()
+    if mode == "r" and isinstance(file, (str, Path)):
+        key = os.path.abspath(file)
+        with _aio_lock:
+            handle = _aio_handles.get(key)
+            if (
+                handle is None
+                or handle.executor is not executor
+                or (handle.future.done() and handle.future.exception() is not None)
+            ):
+                future = executor.submit(wavfile, key, "r", **kwargs)
+                handle = _aio_handles[key] = _AsyncHandle(future, executor, key)
+            else:
+                handle.users += 1
+    else:
+        future = executor.submit(wavfile, file, mode, **kwargs)
+        handle = _AsyncHandle(future, executor)
+    try:
+        fp = await asyncio.shield(asyncio.wrap_future(handle.future))
+    except BaseException:
+        handle.release()
+        raise
+    return AsyncWavfile(handle, fp)
+
+
+class Stats:
+    """Totals of the operations reported by instrumented code.
+
+    Counts the calls, bytes, and time (in s) for each operation. Use
+    set_tracer(stats) to start recording, where stats is an instance of
+    this class (e.g. ewave.stats), and set_tracer(None) to stop. Operations
+    are:
+
+    'open':  creating a wavfile, including parsing the header
+    'header':  parsing the header (bytes is the size of the header)
+    'map':  creating a memmap (bytes is the size of the mapping)
+    'read':  wavfile.read() (bytes is the size of the returned array). Data
+             in memmaps are loaded from disk when they're accessed, which
+             isn't included in the time.
+    'rescale:SRC->TGT':  converting data from SRC to TGT (e.g.
+                         'rescale:int16->float32'), by rescale() or write()
+    'write':  wavfile.write()
+    'copy':  copying encoded data between files (concatenate() and extract())
+    'flush':  wavfile.flush(), and flushing when the file is closed
+
+    The totals can be updated from multiple threads.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._totals: dict[str, list] = {}
+
+    def __call__(self, op: str, nbytes: int, seconds: float):
+        with self._lock:
+            totals = self._totals.get(op)
+            if totals is None:
+                totals = self._totals[op] = [0, 0, 0.0]
+            totals[0] += 1
+            totals[1] += nbytes
+            totals[2] += seconds
+
+    def reset(self):
+        """Clears the totals"""
+        with self._lock:
+            self._totals.clear()
+
+    def as_dict(self) -> dict[str, dict]:
+        """Returns the totals as {operation: {'count', 'bytes', 'seconds'}}"""
+        with self._lock:
+            return {
+                op: {"count": count, "bytes": nbytes, "seconds": seconds}
+                for op, (count, nbytes, seconds) in sorted(self._totals.items())
+            }
+
+    def to_prometheus(self, prefix: str = "ewave") -> str:
+        """Returns the totals as counters in the Prometheus text format"""
+        totals = self.as_dict()
+        lines = []
+        for name, field in (
+            ("operations_total", "count"),
+            ("bytes_total", "bytes"),
+            ("seconds_total", "seconds"),
+        ):
+            lines.append(f"# TYPE {prefix}_{name} counter")
+            for op, values in totals.items():
+                lines.append(f'{prefix}_{name}{{op="{op}"}} {values[field]}')
+        return "\n".join(lines) + "\n"
+
+
+# the default registry for set_tracer()
+stats = Stats()
+
+
+def set_tracer(tracer: Callable[[str, int, float], None] | None):
+    """Sets a function to call after each instrumented operation.
+
+    The function is called with the name of the operation, the number of bytes
+    involved, and the time taken in seconds (see Stats for the operations). It
+    may be called from multiple threads. Use None (the default) to turn off
+    tracing, which reduces the cost of the instrumentation to checking a
+    global variable.
+
+    Returns the previous tracer.
+    """
+    global _tracer
+    previous, _tracer = _tracer, tracer
+    return previous
+
+
+def _parse_header_update(policy: str) -> tuple[str, float]:
+    """Parses a header update policy into (name, value)"""
+    name, _, value = policy.partition("=")
+    if name in ("flush", "every_write", "on_close") and not value:
+        return name, 0
+    if name in ("interval", "bytes") and value:
+        try:
+            return name, float(value)
+        except ValueError:
+            pass
+    raise ValueError(f"invalid header update policy: {policy}")
+
+
+def repair(path: str | Path) -> int:
+    """Fixes the size fields in the header of a file that wasn't closed cleanly.
+
+    The size of the data chunk is calculated from the length of the file, so
+    this only works if the data chunk is the last chunk in the file, which is
+    the case for files written by this module. If the data chunk is followed
+    by complete chunks (e.g., LIST metadata), the header is assumed to be
+    correct and isn't changed. Returns the number of frames.
+    """
+    fp = wavfile(path, "r+")
+    framesize = fp.nchannels * fp.sampwidth
+    size = fp._data_size
+    end = fp._data_offset + size + (size & 1)
+    length = fp._data_offset + fp._bytes_written
+    if size and length > end and _chunks_fill(fp.fp, end, length):
+        fp._bytes_written = fp._write_pos = fp._header_bytes = size
+        nframes = fp.nframes
+        fp.__del__()
+        return nframes
+    # drop any incomplete frame at the end
+    fp._bytes_written = fp._write_pos = fp._bytes_written // framesize * framesize
+    fp._header_bytes = None
+    nframes = fp.nframes
+    fp.__del__()
+    return nframes
+
+
+def open_member(archive: str | Path, member: str, **kwargs) -> wavfile:
+    """Opens a WAVE file stored in a zip or tar archive for reading.
+
+    If the member is stored without compression, its data are mapped directly
+    from the archive file by read(), so it doesn't need to be extracted.
+    Compressed members are decompressed into memory.
+
+    - archive: the path of the zip or tar file
+    - member: the name of the WAVE file in the archive
+    - additional keyword arguments are passed to wavfile (e.g., header_cache)
+    """
+    import struct
+    import tarfile
+    import zipfile
+    from builtins import open  # noqa: UP029
+
+    if zipfile.is_zipfile(archive):
+        with zipfile.ZipFile(archive) as zf:
+            info = zf.getinfo(member)
+            if info.compress_type != zipfile.ZIP_STORED or info.flag_bits & 0x1:
+                return wavfile(zf.read(info), **kwargs)
+        fp = open(archive, "rb")
+        # the data follow the local header, whose extra field can differ from
+        # the one in the central directory
+        fp.seek(info.header_offset)
+        local = fp.read(30)
+        if local[:4] != b"PK\x03\x04":
+            fp.close()
+            raise Error(f"bad local header for {member} in {archive}")
+        namelen, extralen = struct.unpack_from(b"<HH", local, 26)
+        start = info.header_offset + 30 + namelen + extralen
+        return wavfile(_FileSection(fp, start, info.file_size, member), **kwargs)
+
+    try:
+        tf = tarfile.open(archive, "r:")
+    except tarfile.ReadError:
+        # compressed archive
+        with tarfile.open(archive) as tf:
+            return wavfile(tf.extractfile(member).read(), **kwargs)
+    with tf:
+        info = tf.getmember(member)
+        if not info.isreg() or info.sparse is not None:
+            # links and sparse files have to go through tarfile
+            data = tf.extractfile(info)
+            if data is None:
+                raise Error(f"{member} in {archive} is not a file")
+            return wavfile(data.read(), **kwargs)
+    fp = open(archive, "rb")
+    return wavfile(_FileSection(fp, info.offset_data, info.size, member), **kwargs)
+
+
+def concatenate(
+    inputs: Iterable[str | Path | wavfile],
+    output: str | Path | wavfile,
+    mode: str = "w",
+    **kwargs,
+) -> int:
+    """Concatenates the data in WAVE files into one file.
+
+    If the format of an input matches the output, its data are copied between
+    the files without being decoded, by the kernel if the platform supports it
+    (os.copy_file_range or os.sendfile). Otherwise, the data are rescaled in
+    blocks. All the files must have the same sampling rate and number of
+    channels.
+
+    - inputs: the files to concatenate, as paths or open wavfiles
+    - output: the path of the output file, or a writable wavfile to append to
+    - mode: if output is a path, 'w' to create it or 'r+' to append to it
+    - additional keyword arguments are passed to wavfile when creating the
+      output. By default, the output has the format of the first input.
+
+    Returns the number of frames written.
+    """
+    written = 0
+    dst = None
+    try:
+        for file in inputs:
+            with _opened(file) as src:
+                if dst is None:
+                    dst = _open_output(output, mode, src, kwargs)
+                written += _copy_frames(src, dst, 0, src.nframes)
+    finally:
+        if dst is not None and dst is not output:
+            dst.__del__()
+    return written
+
+
+def extract(
+    src: str | Path | wavfile,
+    dst: str | Path | wavfile,
+    offset: int = 0,
+    frames: int | None = None,
+    mode: str = "w",
+    **kwargs,
+) -> int:
+    """Copies part of a WAVE file into another file.
+
+    Data are copied as in concatenate().
+
+    - src: the file to copy from, as a path or an open wavfile
+    - dst: the path of the output file, or a writable wavfile to append to
+    - offset: the first frame to copy
+    - frames: the number of frames to copy. If None, copies to the end of src.
+    - mode: if dst is a path, 'w' to create it or 'r+' to append to it
+    - additional keyword arguments are passed to wavfile when creating dst.
+      By default, dst has the format of src.
+
+    Returns the number of frames written.
+    """
+    with _opened(src) as fp:
+        out = _open_output(dst, mode, fp, kwargs)
+        try:
+            if frames is None:
+                frames = fp.nframes - offset
+            return _copy_frames(fp, out, offset, frames)
+        finally:
+            if out is not dst:
+                out.__del__()
+
+
+def convert(
+    src: str | Path | wavfile,
+    dst: str | Path,
+    dtype: npt.DTypeLike | None = None,
+    nchannels_map: Iterable[int] | None = None,
+    workers: int | None = None,
+    sampwidth: int | None = None,
+) -> int:
+    """Converts a WAVE file to a different storage format, using multiple threads.
+
+    The output is preallocated, and the data are divided into blocks of frames
+    that are rescaled from a memmap of the source and written to the output
+    with os.pwrite. Numpy and the system calls release the GIL, so the blocks
+    are converted in parallel.
+
+    - src: the file to convert, as a path or an open wavfile
+    - dst: the path of the output file, which is overwritten
+    - dtype: the storage type of the output. If None, uses the type of src.
+    - nchannels_map: if not None, the channels of src to store in the output,
+                     in order (e.g., [1, 0] to swap two channels)
+    - workers: the number of threads to use. If None, uses the default for
+               concurrent.futures.ThreadPoolExecutor
+    - sampwidth: the sample width of the output (e.g., 3 for packed 24-bit)
+
+    Returns the number of frames converted.
+    """
+    import os
+    from concurrent.futures import ThreadPoolExecutor
+
+    with _opened(src) as fp:
+        if nchannels_map is None:
+            channels = slice(None)
+            nchannels = fp.nchannels
+        else:
+            channels = _as_slice(nchannels_map, fp.nchannels)
+            nchannels = len(np.arange(fp.nchannels)[channels])
+        if dtype is None:
+            dtype = fp.dtype
+            if sampwidth is None:
+                sampwidth = fp.sampwidth
+        nframes = fp.nframes
+        out = wavfile(
+            dst,
+            "w",
+            sampling_rate=fp.sampling_rate,
+            dtype=dtype,
+            nchannels=nchannels,
+            sampwidth=sampwidth,
+            nframes=nframes,
+        )
+        try:
+            framesize = nchannels * out.sampwidth
+            rows = max(1, _BLOCKSIZE // nchannels)
+            nblocks = -(-nframes // rows)
+            if workers is None:
+                workers = min(32, (os.cpu_count() or 1) + 4)
+            workers = max(1, min(workers, nblocks))
+            fd = out.fp.fileno()
+            local = threading.local()
+
+            def convert_blocks(first):
+                # each thread converts every workers-th block
+                for i in range(first * rows, nframes, workers * rows):
+                    n = min(rows, nframes - i)
+                    block = fp.read(n, i, memmap="r", channels=channels)
+                    if not hasattr(local, "buf"):
+                        local.buf = np.empty(rows * nchannels, dtype=out.dtype)
+                        local.packed = np.empty((rows * nchannels, 3), dtype="B")
+                    data = local.buf[: block.size].reshape(block.shape)
+                    rescale(block, out.dtype, out=data)
+                    if out.sampwidth == 3:
+                        data = _pack24(data, local.packed)
+                    os.pwrite(
+                        fd, memoryview(data).cast("B"), out._data_offset + i * framesize
+                    )
+
+            if hasattr(os, "pwrite"):
+                with ThreadPoolExecutor(workers) as pool:
+                    for _ in pool.map(convert_blocks, range(workers)):
+                        pass
+            else:
+                # write() fills the preallocated data chunk sequentially
+                for i in range(0, nframes, rows):
+                    out.write(fp.read(min(rows, nframes - i), i, channels=channels))
+        finally:
+            out.__del__()
+    return nframes
+
+
+def _opened(file: str | Path | wavfile):
+    """Returns a context manager for file opened in 'r' mode, which only closes
+    it if it wasn't already open"""
+    from contextlib import nullcontext
+
+    return nullcontext(file) if isinstance(file, wavfile) else wavfile(file, "r")
+
+
+def _open_output(
+    output: str | Path | wavfile, mode: str, template: wavfile, kwargs: dict
+) -> wavfile:
+    """Opens output for writing, using the format of template if it's created"""
+    if isinstance(output, wavfile):
+        return output
+    if mode == "r+":
+        return wavfile(output, "r+", **kwargs)
+    if mode != "w":
+        raise ValueError("Invalid mode (use 'w', 'r+')")
+    options = {
+        "sampling_rate": template.sampling_rate,
+        "dtype": template.dtype,
+        "nchannels": template.nchannels,
+    }
+    if "dtype" not in kwargs:
+        options["sampwidth"] = template.sampwidth
+    options.update(kwargs)
+    return wavfile(output, "w", **options)
+
+
+def _copy_frames(src: wavfile, dst: wavfile, offset: int, frames: int) -> int:
+    """Appends frames of data starting at offset in src to dst. Returns the
+    number of frames copied."""
+    if src.sampling_rate != dst.sampling_rate:
+        raise Error(
+            f"sampling rates differ ({src.sampling_rate} != {dst.sampling_rate})"
+        )
+    if src.nchannels != dst.nchannels:
+        raise Error(f"channel counts differ ({src.nchannels} != {dst.nchannels})")
+    if offset < 0:
+        raise ValueError("offset must not be negative")
+    frames = max(0, min(frames, src.nframes - offset))
+    if frames == 0:
+        return 0
+    framesize = src.nchannels * src.sampwidth
+    try:
+        src.fp.fileno()
+        dst.fp.fileno()
+        raw = src.dtype == dst.dtype and src.sampwidth == dst.sampwidth
+    except (AttributeError, OSError):
+        raw = False
+    if raw:
+        if src.mode != "r":
+            src.fp.flush()
+        dst._write_from(
+            src.fp, src._data_offset + offset * framesize, frames * framesize
+        )
+    else:
+        rows = max(1, _BLOCKSIZE // src.nchannels)
+        for i in range(offset, offset + frames, rows):
+            n = min(rows, offset + frames - i)
+            dst.write(src.read(n, i, memmap=False))
+    return frames
+
+
+class _SeekableReader:
+    """Base class for read-only file-like objects of known size"""
+
+    mode = "rb"
+    name = None
+
+    def __init__(self, size: int):
+        self._size = size
+        self._pos = 0
+
+    def seek(self, offset: int, whence: int = 0) -> int:
+        if whence == 1:
+            offset += self._pos
+        elif whence == 2:
+            offset += self._size
+        if offset < 0:
+            raise ValueError(f"negative seek position {offset}")
+        self._pos = offset
+        return offset
+
+    def tell(self) -> int:
+        return self._pos
+
+    def _available(self, size: int | None) -> int:
+        avail = max(0, self._size - self._pos)
+        return avail if size is None or size < 0 else min(size, avail)
+
+
+class _BufferFile(_SeekableReader):
+    """A file-like object for a buffer. Unlike io.BytesIO, the data aren't
+    copied, and getbuffer() returns a view of the original buffer."""
+
+    def __init__(self, buffer):
+        self._view = memoryview(buffer).cast("B")
+        super().__init__(len(self._view))
+
+    def getbuffer(self) -> memoryview:
+        return self._view
+
+    def read(self, size: int | None = -1) -> bytes:
+        n = self._available(size)
+        data = self._view[self._pos : self._pos + n].tobytes()
+        self._pos += n
+        return data
+
+    def readinto(self, b) -> int:
+        view = memoryview(b).cast("B")
+        n = self._available(len(view))
+        view[:n] = self._view[self._pos : self._pos + n]
+        self._pos += n
+        return n
+
+    def close(self):
+        pass
+
+
+class _FileSection(_SeekableReader):
+    """A file-like object for the part of fileobj that starts at start and
+    is size bytes long, e.g. a member of an archive. Closing it closes
+    fileobj."""
+
+    def __init__(self, fileobj: BinaryIO, start: int, size: int, name: str):
+        super().__init__(size)
+        self.fileobj = fileobj
+        self.start = start
+        self.name = name
+
+    def read(self, size: int | None = -1) -> bytes:
+        self.fileobj.seek(self.start + self._pos)
+        data = self.fileobj.read(self._available(size))
+        self._pos += len(data)
+        return data
+
+    def readinto(self, b) -> int:
+        view = memoryview(b).cast("B")
+        self.fileobj.seek(self.start + self._pos)
+        n = self.fileobj.readinto(view[: self._available(len(view))])
+        self._pos += n
+        return n
+
+    def close(self):
+        self.fileobj.close()
+
+
+# record type returned by scan()
+scan_dtype = np.dtype(
+    [
+        ("nframes", "<i8"),
+        ("sampling_rate", "<i4"),
+        ("nchannels", "<i4"),
+        ("dtype", "U4"),
+        ("sampwidth", "u1"),
+        ("data_offset", "<i8"),
+    ]
+)
+
+
+# record type returned by wavfile.summary(), with one record for each channel
+summary_dtype = np.dtype(
+    [
+        ("min", "<f8"),
+        ("max", "<f8"),
+        ("peak", "<f8"),
+        ("rms", "<f8"),
+        ("dc", "<f8"),
+        ("clipped", "<i8"),
+        ("nan", "<i8"),
+    ]
+)
+
+
+def scan(paths: Iterable[str | Path], workers: int | None = None) -> np.ndarray:
+    """Reads the format of many WAVE files without opening them as wavfiles.
+
+    In most files, the header can be parsed from a single read of the start of
+    the file; the chunks are only walked one by one if there's too much metadata
+    before the data chunk. Files are scanned in parallel using a pool of
+    threads.
+
+    - paths: the files to scan
+    - workers: the maximum number of threads to use. If None, uses the default
+               for concurrent.futures.ThreadPoolExecutor
+
+    Returns a structured array of records with dtype scan_dtype, in the same
+    order as paths. The dtype field is the string representation of the
+    storage type (e.g. '<i2').
+    """
+    from concurrent.futures import ThreadPoolExecutor
+
+    paths = list(paths)
+    out = np.zeros(len(paths), dtype=scan_dtype)
+
+    def scan_batch(start):
+        # files are handed to the threads in batches because scanning a single
+        # file takes about as long as submitting a task to the pool
+        for i in range(start, min(start + _SCAN_BATCH, len(paths))):
+            try:
+                out[i] = _scan_file(paths[i])
+            except (Error, EOFError, OSError) as err:
+                raise Error(f"{paths[i]}: {err}") from err
+
+    with ThreadPoolExecutor(workers) as pool:
+        for _ in pool.map(scan_batch, range(0, len(paths), _SCAN_BATCH)):
+            pass
+    return out
+
+
+def _scan_file(path: str | Path) -> tuple:
+    """Returns the fields of a scan_dtype record for path"""
+    import os
+
+    if hasattr(os, "pread"):
+        fd = os.open(path, os.O_RDONLY)
+        try:
+            buf = os.pread(fd, _HEADER_PEEK, 0)
+        finally:
+            os.close(fd)
+    else:
+        from builtins import open  # noqa: UP029
+
+        with open(path, "rb", buffering=0) as fp:
+            buf = fp.read(_HEADER_PEEK)
+    header = _parse_header(buf)
+    if header is None:
+        with wavfile(path, "r") as fp:
+            return (
+                fp.nframes,
+                fp.sampling_rate,
+                fp.nchannels,
+                fp.dtype.str,
+                fp.sampwidth,
+                fp._data_offset,
+            )
+    return (
+        header["data_size"] // (header["sampwidth"] * header["nchannels"]),
+        header["framerate"],
+        header["nchannels"],
+        header["dtype"].str,
+        header["sampwidth"],
+        header["data_offset"],
+    )
+
+
+def read_many(
+    paths: Iterable[str | Path],
+    dtype: npt.DTypeLike = "float32",
+    frames: int | None = None,
+    offsets: int | Iterable[int] | None = None,
+    workers: int | None = None,
+    out: np.ndarray | None = None,
+    ragged: str = "pad",
+    fill: float = 0,
+) -> np.ndarray:
+    """Reads the data from many WAVE files into the rows of one array.
+
+    Each file is decoded directly into its row of the output, using a pool of
+    threads. The output has shape (files, frames) for single-channel files
+    and (files, frames, channels) for multichannel files. All the files must
+    have the same number of channels; sampling rates are not checked.
+
+    - paths: the files to read
+    - dtype: the data type of the output. Data are rescaled as in rescale().
+    - frames: the number of frames to read from each file. Longer files are
+              cropped and shorter files are padded with fill. If None, the
+              length is chosen according to ragged.
+    - offsets: the frame to start reading at, either for all the files or as
+               a sequence with one value per file
+    - workers: the maximum number of threads to use. If None, uses the default
+               for concurrent.futures.ThreadPoolExecutor
+    - out: if not None, the array where the data are stored (e.g., one in
+           shared memory). Its shape determines frames, and its dtype
+           overrides dtype.
+    - ragged: if frames is None, how to handle files of different lengths:
+              'pad' to the longest file, 'crop' to the shortest, or 'error'
+    - fill: the value used to pad short files
+
+    Returns out, or a new array if out is None.
+    """
+    from concurrent.futures import ThreadPoolExecutor
+
+    if ragged not in ("pad", "crop", "error"):
+        raise ValueError("Invalid ragged policy (use 'pad', 'crop', 'error')")
+    paths = list(paths)
+    offsets = np.broadcast_to(
+        np.asarray(0 if offsets is None else offsets, dtype="i8"), len(paths)
+    )
+    if out is not None:
+        if out.ndim not in (2, 3) or out.shape[0] != len(paths):
+            raise ValueError(f"out must have shape ({len(paths)}, frames[, channels])")
+        frames = out.shape[1]
+        nchannels = out.shape[2] if out.ndim == 3 else 1
+    elif len(paths) == 0:
+        return np.empty((0, frames or 0), dtype=dtype)
+    else:
+        if frames is None:
+            info = scan(paths, workers)
+            lengths = np.maximum(info["nframes"] - offsets, 0)
+            if ragged == "error" and (lengths != lengths[0]).any():
+                raise Error("files have different lengths")
+            frames = lengths.min() if ragged == "crop" else lengths.max()
+            nchannels = info["nchannels"][0]
+        else:
+            nchannels = _scan_file(paths[0])[2]
+        shape = (
+            (len(paths), frames) if nchannels == 1 else (len(paths), frames, nchannels)
+        )
+        out = np.empty(shape, dtype=dtype)
+
+    def read_file(i):
+        try:
+            with wavfile(paths[i], "r") as fp:
+                if fp.nchannels != nchannels:
+                    raise Error(f"expected {nchannels} channels, not {fp.nchannels}")
+                offset = int(offsets[i])
+                row = out[i]
+                n = max(0, min(frames, fp.nframes - offset))
+                if n > 0:
+                    target = row[:n]
+                    if target.ndim == 2 and nchannels == 1:
+                        # out has a channel axis of length 1
+                        target = target[:, 0]
+                    fp.read(n, offset, out=target)
+                row[n:] = fill
+        except (Error, EOFError, OSError) as err:
+            raise Error(f"{paths[i]}: {err}") from err
+
+    with ThreadPoolExecutor(workers) as pool:
+        for _ in pool.map(read_file, range(len(paths))):
+            pass
+    return out
+
+
+def build_peaks(
+    path: str | Path,
+    binsize: int = 256,
+    factor: int = 4,
+    workers: int | None = None,
+    sidecar: str | Path | None = None,
+) -> Envelope:
+    """Returns the min/max/RMS envelope of a WAVE file, using a cached copy if
+    possible.
+
+    The envelope is stored in a sidecar file, which is only used if the
+    modification time and size of the WAVE file haven't changed since it was
+    written and it was built with the same binsize and factor. Otherwise, the
+    envelope is computed with wavfile.envelope() and the sidecar is replaced.
+
+    - path: the WAVE file
+    - binsize, factor, workers: see wavfile.envelope()
+    - sidecar: the location of the cached envelope. Defaults to the path of
+               the WAVE file with '.peaks.npz' appended. Should end in
+               '.npz'.
+    """
+    if sidecar is None:
+        sidecar = f"{path}.peaks.npz"
+    key = _sidecar_key(path)
+    env = _load_sidecar(
+        sidecar, Envelope._from_npz, **key, binsize=binsize, factor=factor
+    )
+    if env is None:
+        with wavfile(path, "r") as fp:
+            env = fp.envelope(binsize, factor, workers)
+        _save_sidecar(sidecar, lambda file: env.save(file, **key))
+    return env
+
+
+def summarize(
+    path: str | Path,
+    channels: int | slice | Iterable[int] | None = None,
+    workers: int | None = None,
+    sidecar: str | Path | None = None,
+) -> np.ndarray:
+    """Returns summary statistics for the channels of a WAVE file, using a
+    cached copy if possible.
+
+    The statistics for all the channels are stored in a sidecar file, which is
+    only used if the modification time and size of the WAVE file haven't
+    changed since it was written. Otherwise, they are computed with
+    wavfile.summary() and the sidecar is replaced.
+
+    - path: the WAVE file
+    - channels: if not None, the channel or channels to return
+    - workers: see wavfile.summary()
+    - sidecar: the location of the cached statistics. Defaults to the path of
+               the WAVE file with '.summary.npz' appended. Should end in
+               '.npz'.
+    """
+    if sidecar is None:
+        sidecar = f"{path}.summary.npz"
+    key = _sidecar_key(path)
+    stats = _load_sidecar(sidecar, lambda data: data["summary"], **key)
+    if stats is None:
+        with wavfile(path, "r") as fp:
+            stats = fp.summary(workers=workers)
+        _save_sidecar(sidecar, lambda file: np.savez(file, summary=stats, **key))
+    if channels is None:
+        return stats
+    if not isinstance(channels, slice):
+        import operator
+
+        try:
+            channels = operator.index(channels)
+        except TypeError:
+            channels = _as_slice(channels, stats.size)
+    return stats[channels]
+
+
+def _sidecar_key(path: str | Path) -> dict:
+    """Returns the values used to check that a sidecar still matches path"""
+    import os
+
+    st = os.stat(path)
+    return {"mtime_ns": st.st_mtime_ns, "size": st.st_size}
+
+
+def _load_sidecar(sidecar: str | Path, load: Callable, **expected):
+    """Returns load(data) for the contents of the .npz file sidecar if it
+    stores the expected values. Returns None if it doesn't, or if it's missing
+    or can't be read for any reason."""
+    try:
+        with np.load(sidecar) as data:
+            if all(data[name] == value for name, value in expected.items()):
+                return load(data)
+    except Exception:
+        # a truncated or corrupt sidecar is just a cache miss
+        pass
+    return None
+
+
+def _save_sidecar(sidecar: str | Path, save: Callable[[BinaryIO], None]):
+    """Calls save() on a temporary file and moves it to sidecar, so that other
+    processes never see a partly written file. Errors writing the file (e.g.,
+    to a read-only directory) are ignored, because it's only a cache."""
+    import os
+    from builtins import open  # noqa: UP029
+
+    tmp = f"{sidecar}.{os.getpid()}.{threading.get_ident()}.tmp"
+    try:
+        with open(tmp, "wb") as fp:
+            save(fp)
+        os.replace(tmp, sidecar)
+    except OSError:
+        pass
+    finally:
+        try:
+            os.unlink(tmp)
+        except OSError:
+            pass
+
+
+def _parse_fmt(data: bytes) -> tuple[int, int, int, np.dtype, int]:
+    """Parses the contents of a fmt chunk.
+
+    Returns (format tag, number of channels, sampling rate, storage dtype,
+    sample width in bytes)
+    """
+    import struct
+
+    from numpy import dtype
+
+    if len(data) < 16:
+        raise Error("fmt chunk is too short")
+    (
+        tag,
+        nchannels,
+        framerate,
+        _nAvgBytesPerSec,
+        _wBlockAlign,
+        bits,
+    ) = struct.unpack(b"<HHLLHH", data[:16])
+    # load extended block if it's there
+    if tag == WAVE_FORMAT_EXTENSIBLE:
+        if len(data) < 26:
+            raise Error("extensible format but no format extension")
+        _cbSize, _wValidBits, _dwChannelMask, tag = struct.unpack(b"<hhlH", data[16:26])
+    if tag == WAVE_FORMAT_PCM:
+        # bit size is rounded up to the nearest multiple of 8. 24-bit
+        # containers can't be mmap'd directly, so they're unpacked into int32
+        if bits <= 8:
+            storage = dtype("B")
+        elif bits <= 16:
+            storage = dtype("<h")
+        elif bits <= 24:
+            return tag, nchannels, framerate, dtype("<i"), 3
+        elif bits <= 32:
+            storage = dtype("<i")
+        elif bits == 64:
+            storage = dtype("<l")
+        else:
+            raise Error(f"unsupported bit depth: {bits}")
+    elif tag == WAVE_FORMAT_IEEE_FLOAT:
+        try:
+            storage = dtype(f"float{bits}")
+        except TypeError as err:
+            raise Error(f"unsupported bit depth for IEEE floats: {bits}") from err
+    else:
+        raise Error(f"unsupported format: {tag}")
+    return tag, nchannels, framerate, storage, storage.itemsize
+
+
+def _parse_header(buf: bytes) -> dict | None:
+    """Parses a WAVE header from a buffer containing the start of the file.
+
+    Returns a dict with the format and the location of the data chunk, or None
+    if the start of the data chunk is not in buf. Raises EOFError if buf is
+    empty and Error if it doesn't contain a supported WAVE file.
+    """
+    import struct
+
+    if len(buf) < 12:
+        raise EOFError
+    riff_id, riff_size, wave_id = struct.unpack_from(b"<4sL4s", buf)
+    if riff_id not in (b"RIFF", b"RF64", b"BW64"):
+        raise Error("file does not start with RIFF id")
+    if wave_id != b"WAVE":
+        raise Error("not a WAVE file")
+    rf64 = riff_id != b"RIFF"
+    ds64_offset = None
+    ds64_data_size = None
+    fmt = None
+    fact = False
+    pos = 12
+    while pos + 8 <= len(buf):
+        chunkname, size = struct.unpack_from(b"<4sL", buf, pos)
+        start = pos + 8
+        if chunkname == b"ds64" and rf64:
+            if start + 16 > len(buf):
+                return None
+            riff_size, ds64_data_size = struct.unpack_from(b"<QQ", buf, start)
+            ds64_offset = pos
+        elif chunkname == b"JUNK" and fmt is None and size == 28:
+            # space reserved for a ds64 chunk if the file grows too large. Only
+            # an exact fit can be used, or the rest of the chunk would be lost
+            ds64_offset = pos
+        elif chunkname == b"fmt ":
+            if start + size > len(buf):
+                return None
+            fmt = _parse_fmt(buf[start : start + size])
+        elif chunkname == b"fact":
+            fact = True
+        elif chunkname == b"data":
+            if fmt is None:
+                raise Error("data chunk before fmt chunk")
+            if rf64:
+                if ds64_data_size is None:
+                    raise Error("RF64 file is missing ds64 chunk")
+                if size == _RF64_SIZE:
+                    size = ds64_data_size
+            tag, nchannels, framerate, dtype, sampwidth = fmt
+            return {
+                "tag": tag,
+                "nchannels": nchannels,
+                "framerate": framerate,
+                "dtype": dtype,
+                "sampwidth": sampwidth,
+                "data_offset": start,
+                "data_size": size,
+                "ds64_offset": ds64_offset,
+                "rf64": rf64,
+                "fact": fact,
+                "postdata": False,
+                "riff_end": riff_size + 8,
+            }
+        pos = start + size + (size & 1)
+    return None
+
+
+def _walk_header(fp: BinaryIO) -> dict:
+    """Parses a WAVE header by walking through all the chunks in fp.
+
+    Returns the same dict as _parse_header. This is slower but it works for
+    headers of any size.
+    """
+    import struct
+
+    riff = Chunk(fp, bigendian=0)
+    riff_id = riff.getname()
+    if riff_id not in (b"RIFF", b"RF64", b"BW64"):
+        raise Error("file does not start with RIFF id")
+    if riff.read(4) != b"WAVE":
+        raise Error("not a WAVE file")
+    rf64 = riff_id != b"RIFF"
+    ds64_offset = None
+    postdata = False
+    fmt_data = None
+    fact_chunk = None
+    data_chunk = None
+    ds64_data_size = None
+    while 1:
+        try:
+            chunk = Chunk(riff, bigendian=0)
+        except EOFError:
+            break
+        chunkname = chunk.getname()
+        if chunkname == b"ds64" and rf64:
+            riff_size, ds64_data_size = struct.unpack(b"<QQ", chunk.read(16))
+            # the 32-bit sizes are placeholders; use the real ones so
+            # that chunks can be skipped correctly
+            riff.chunksize = riff_size
+            ds64_offset = chunk.offset
+        elif chunkname == b"JUNK" and fmt_data is None and chunk.chunksize == 28:
+            ds64_offset = chunk.offset
+        elif chunkname == b"fmt ":
+            fmt_data = chunk.read()
+        elif chunkname == b"fact":
+            fact_chunk = chunk
+        elif chunkname == b"data":
+            if fmt_data is None:
+                raise Error("data chunk before fmt chunk")
+            if rf64:
+                if ds64_data_size is None:
+                    raise Error("RF64 file is missing ds64 chunk")
+                if chunk.chunksize == _RF64_SIZE:
+                    chunk.chunksize = ds64_data_size
+            data_chunk = chunk
+        elif data_chunk and fact_chunk:
+            postdata = True
+        chunk.skip()
+    if fmt_data is None or data_chunk is None:
+        raise Error("fmt and/or data chunk missing")
+
+    tag, nchannels, framerate, dtype, sampwidth = _parse_fmt(fmt_data)
+    return {
+        "tag": tag,
+        "nchannels": nchannels,
+        "framerate": framerate,
+        "dtype": dtype,
+        "sampwidth": sampwidth,
+        "data_offset": data_chunk.offset + 8,
+        "data_size": data_chunk.chunksize,
+        "ds64_offset": ds64_offset,
+        "rf64": rf64,
+        "fact": fact_chunk is not None,
+        "postdata": postdata,
+        "riff_end": riff.chunksize + 8,
+    }
+
+
+def _chunks_fill(fp: BinaryIO, pos: int, end: int) -> bool:
+    """Returns True if the bytes in fp from pos to end are a sequence of
+    complete chunks, which tells chunks that follow the data chunk apart from
+    data that were written without updating the header."""
+    import struct
+
+    while pos + 8 <= end:
+        fp.seek(pos)
+        head = fp.read(8)
+        if len(head) < 8:
+            return False
+        chunkname, size = struct.unpack(b"<4sL", head)
+        if not all(0x20 <= c < 0x7F for c in chunkname):
+            return False
+        pos += 8 + size + (size & 1)
+    # the pad byte after the last chunk is sometimes left out
+    return end <= pos <= end + 1
+
+
+def _as_slice(indices: Iterable[int], size: int) -> slice | np.ndarray:
+    """Converts a sequence of indices into an axis of length size to an
+    equivalent slice if they're evenly spaced, so that indexing returns a view.
+    Otherwise returns the indices as an array."""
+    indices = np.asarray(indices, dtype=np.intp).reshape(-1)
+    indices = np.where(indices < 0, indices + size, indices)
+    if ((indices < 0) | (indices >= size)).any():
+        raise IndexError(f"index out of range for axis with size {size}")
+    if indices.size == 1:
+        return slice(indices[0], indices[0] + 1)
+    steps = np.diff(indices)
+    if indices.size == 0 or steps[0] == 0 or (steps != steps[0]).any():
+        return indices
+    stop = indices[-1] + steps[0]
+    return slice(indices[0], stop if stop >= 0 else None, steps[0])
+
+
+def _copy_range(
+    src: BinaryIO, src_offset: int, dst: BinaryIO, dst_offset: int, nbytes: int
+):
+    """Copies nbytes from src_offset in src to dst_offset in dst.
+
+    The copy is done by the kernel if possible. Data buffered in the file
+    objects are bypassed, so they need to be flushed, and the position of dst
+    needs to be reset afterwards.
+    """
+    import os
+
+    src_fd = src.fileno()
+    dst_fd = dst.fileno()
+    done = 0
+    if hasattr(os, "copy_file_range"):
+        try:
+            while done < nbytes:
+                n = os.copy_file_range(
+                    src_fd, dst_fd, nbytes - done, src_offset + done, dst_offset + done
+                )
+                if n == 0:
+                    break
+                done += n
+        except OSError:
+            # not supported by the kernel or between these filesystems
+            pass
+    if done < nbytes and hasattr(os, "sendfile"):
+        try:
+            os.lseek(dst_fd, dst_offset + done, os.SEEK_SET)
+            while done < nbytes:
+                n = os.sendfile(dst_fd, src_fd, src_offset + done, nbytes - done)
+                if n == 0:
+                    break
+                done += n
+        except OSError:
+            pass
+    pos = src.tell()
+    while done < nbytes:
+        src.seek(src_offset + done)
+        data = src.read(min(nbytes - done, _BLOCKSIZE * 8))
+        if not data:
+            break
+        dst.seek(dst_offset + done)
+        dst.write(data)
+        done += len(data)
+    src.seek(pos)
+    if done < nbytes:
+        raise Error("file is shorter than its data chunk")
+
+
+def _madvise(A: np.ndarray, advice: str, start: int = 0, length: int | None = None):
+    """Advises the kernel how A, a view into a memmap, will be used
+
+    advice is the name of one of the MADV_* constants in the mmap module; start
+    and length are in bytes from the beginning of A. This is only a hint, so it
+    does nothing if the platform or A doesn't support it.
+    """
+    import mmap
+
+    flag = getattr(mmap, advice, None)
+    mm = getattr(A, "_mmap", None)
+    if flag is None or mm is None or mm.closed:
+        return
+    if length is None:
+        length = A.nbytes - start
+    # locate A within the mapping, which may start before the memmap does
+    base = np.frombuffer(mm, dtype="B").ctypes.data
+    start += A.ctypes.data - base
+    aligned = start - start % mmap.PAGESIZE
+    length = min(length + start - aligned, len(mm) - aligned)
+    if length <= 0:
+        return
+    try:
+        mm.madvise(flag, aligned, length)
+    except (OSError, ValueError):
+        pass
+
+
+def _unpack24(raw: np.ndarray, out: np.ndarray) -> np.ndarray:
+    """Decodes packed little-endian 24-bit samples in raw (uint8) into out (<i4)
+
+    raw must start with one padding byte before the first sample. Each sample
+    is read as a 32-bit integer through an overlapping view with a stride of
+    three bytes, and the low byte (from the preceding sample) is masked off, so
+    the values are scaled to the full range of a 32-bit integer.
+    """
+    n = (raw.size - 1) // 3
+    words = np.ndarray(shape=(n,), dtype="<i4", buffer=raw, strides=(3,))
+    return np.bitwise_and(words, -256, out=out[:n])
+
+
+def _pack24(data: np.ndarray, buf: np.ndarray) -> np.ndarray:
+    """Encodes 32-bit integer samples as packed 24-bit samples
+
+    Uses the upper three bytes of each sample. buf is a uint8 array with
+    shape (n, 3) and at least as many rows as data has samples; returns the
+    part of buf that was filled.
+    """
+    src = np.ascontiguousarray(data, dtype="<i4").view("B").reshape(-1, 4)
+    out = buf[: src.shape[0]]
+    out[:] = src[:, 1:]
+    return out
+
+
+def rescale(
+    data: npt.ArrayLike, tgt_dtype: npt.DTypeLike, out: np.ndarray | None = None
+) -> np.ndarray:
     """Rescales data to the correct range for tgt_dtype.
 
     - data: a numpy array or anything convertable into one.
     - tgt_dtype: the data type of the target container
+    - out: if not None, an array with dtype tgt_dtype and the same shape as data
+           where the result is stored. Conversions from float to integer types
+           go through a small temporary buffer.
+
+    Returns the rescaled data, which is out if that was supplied. If out is None
+    and no conversion is needed, returns data without copying it.
     """
-    from numpy import asarray, dtype, maximum, minimum
+    from numpy import asarray, dtype
 
     # convert to numpy array, retaining best type
     data = asarray(data)
-    src = data.dtype
     tgt = dtype(tgt_dtype)
-    if src == tgt:
-        return data
+    if out is not None and out.dtype != tgt:
+        raise ValueError(f"out has dtype {out.dtype} but target is {tgt}")
+    return _rescaler(data.dtype, tgt)(data, out)
+
 
-    if tgt.kind == "f":
-        if src.kind == "f":
-            return data.astype(tgt)
-        umax = 1 << (src.itemsize * 8 - 1)
-        out = (data / umax).astype(tgt)
-        if src.kind == "u":
-            out -= 1.0
+def _rescaler(
+    src: np.dtype, tgt: np.dtype
+) -> Callable[[np.ndarray, np.ndarray | None], np.ndarray]:
+    """Returns a function f(data, out) that rescales data from src to tgt.
+
+    The function for each pair of types is only made once, so that callers
+    converting many blocks don't pay for choosing a conversion each time.
+    If a tracer is set, calls to the function are reported to it.
+    """
+    convert = _rescalers.get((src, tgt))
+    if convert is None:
+        convert = _rescalers[src, tgt] = _make_rescaler(src, tgt)
+    tracer = _tracer
+    if tracer is None:
+        return convert
+    op = f"rescale:{src.name}->{tgt.name}"
+
+    def traced(data, out):
+        start = time.perf_counter()
+        out = convert(data, out)
+        tracer(op, data.nbytes, time.perf_counter() - start)
         return out
 
-    elif src.kind == "f" and tgt.kind in ("i", "u"):
+    return traced
+
+
+def _make_rescaler(
+    src: np.dtype, tgt: np.dtype
+) -> Callable[[np.ndarray, np.ndarray | None], np.ndarray]:
+    from numpy import asarray, copyto
+
+    if tgt.kind not in ("f", "i", "u"):
+        raise Error(f"unsupported target type {tgt}")
+
+    if src == tgt:
+
+        def convert(data, out):
+            if out is None:
+                return data
+            copyto(out, data)
+            return out
+
+    elif tgt.kind == "f" and src.kind == "f":
+
+        def convert(data, out):
+            if out is None:
+                return data.astype(tgt)
+            copyto(out, data)
+            return out
+
+    elif tgt.kind == "f":
+        # the scale is a power of two, so it's exact in the target precision,
+        # which is much faster than dividing in double precision
+        scale = tgt.type(1.0 / (1 << (src.itemsize * 8 - 1)))
+
+        def convert(data, out):
+            out = np.multiply(data, scale, out=out, dtype=tgt)
+            if src.kind == "u":
+                out -= 1.0
+            return out
+
+    elif src.kind == "f":
         umax = 1 << (tgt.itemsize * 8 - 1)
-        out = data * umax
-        # assume positive clipping - may break on other architectures
-        out = minimum(maximum(out, -umax), umax - 1).astype(tgt)
+        work = np.result_type(src, np.float32)
+        lo = work.type(-umax)
+        hi = work.type(umax - 1)
+        if hi >= umax:
+            # umax - 1 rounds up in this precision, which would overflow
+            hi = np.nextafter(work.type(umax), work.type(0))
+        # unsigned types are filled through a signed view and then offset
+        signed = tgt.newbyteorder("=").str.replace("u", "i")
+
+        def convert(data, out):
+            if out is None:
+                out = np.empty(data.shape, dtype=tgt)
+            dst = out.view(signed) if tgt.kind == "u" else out
+            if data.ndim == 0:
+                data, dst = data[np.newaxis], dst[np.newaxis]
+            # scale, clip, and cast blocks small enough to stay in cache
+            rowsize = data.size // data.shape[0] if data.shape[0] else 1
+            rows = max(1, _RESCALE_BLOCK // max(rowsize, 1))
+            buf = np.empty(min(rows, data.shape[0]) * rowsize, dtype=work)
+            for i in range(0, data.shape[0], rows):
+                block = data[i : i + rows]
+                tmp = buf[: block.size].reshape(block.shape)
+                np.multiply(block, umax, out=tmp)
+                np.clip(tmp, lo, hi, out=tmp)
+                copyto(dst[i : i + rows], tmp, casting="unsafe")
+            if tgt.kind == "u":
+                out += asarray(umax, dtype=tgt)
+            return out
 
-    elif tgt.kind in ("i", "u"):
-        if tgt > src:
-            out = data.astype(tgt) << (tgt.itemsize - src.itemsize) * 8
-        else:
-            out = (data >> (src.itemsize - tgt.itemsize) * 8).astype(tgt)
     else:
-        raise Error(f"unsupported target type {tgt}")
+        shift = abs(tgt.itemsize - src.itemsize) * 8
+        widen = tgt > src
+        offset = (src.kind != tgt.kind and src.kind == "u") or tgt.kind == "u"
+
+        def convert(data, out):
+            if widen:
+                if out is None:
+                    out = data.astype(tgt)
+                else:
+                    copyto(out, data, casting="unsafe")
+                out <<= shift
+            elif out is None:
+                out = (data >> shift).astype(tgt)
+            else:
+                np.right_shift(data, shift, out=out, casting="unsafe")
+            if offset:
+                out += asarray(1, dtype=tgt) << tgt.itemsize * 8 - 1
+            return out
+
+    return convert
+
+
+def main(argv: list[str] | None = None) -> int:
+    """Runs the command-line interface (python -m ewave)"""
+    import argparse
+
+    parser = argparse.ArgumentParser(
+        prog="python -m ewave", description="Process WAVE files"
+    )
+    commands = parser.add_subparsers(dest="command", required=True)
+    cmd = commands.add_parser(
+        "convert", help="convert a file to a different storage format"
+    )
+    cmd.add_argument("src", help="the file to convert")
+    cmd.add_argument("dst", help="the output file (overwritten if it exists)")
+    cmd.add_argument(
+        "-t", "--dtype", help="storage type of the output (e.g., h, i, f, d)"
+    )
+    cmd.add_argument(
+        "-w", "--sampwidth", type=int, help="sample width of the output, in bytes"
+    )
+    cmd.add_argument(
+        "-c", "--channels", help="comma-separated list of channels to keep, in order"
+    )
+    cmd.add_argument("-j", "--workers", type=int, help="number of threads to use")
+    args = parser.parse_args(argv)
+
+    try:
+        if args.command == "convert":
+            channels = None
+            if args.channels is not None:
+                channels = [int(c) for c in args.channels.split(",")]
+            convert(
+                args.src,
+                args.dst,
+                dtype=args.dtype,
+                nchannels_map=channels,
+                workers=args.workers,
+                sampwidth=args.sampwidth,
+            )
+    except (Error, OSError, ValueError, TypeError, IndexError) as err:
+        parser.exit(1, f"{parser.prog}: error: {err}\n")
+    return 0
 
-    if (src.kind != tgt.kind and src.kind == "u") or tgt.kind == "u":
-        out += asarray(1, dtype=tgt) << tgt.itemsize * 8 - 1
 
-    return out
+if __name__ == "__main__":
+    import sys
 
+    sys.exit(main())
 
 # Variables:
 # End:
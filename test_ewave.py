@@ -1,6 +1,7 @@
 # -*- mode: python -*-
 # Copyright (C) 2012 Dan Meliza <dan@meliza.org>
 # Created Tue Aug 14 15:03:19 2012
+import struct
 import sys
 from pathlib import Path
 
@@ -268,5 +269,1138 @@ def test16_read_from_zip(tmp_path):
                 assert_array_almost_equal(src_data, dst_data)
 
 
+def test17_write_after_flush(tmp_file):
+    d1 = np.arange(100, dtype="h")
+    with ewave.open(tmp_file, "w+", sampling_rate=Fs, dtype="h") as fp:
+        fp.write(d1, scale=False).flush()
+        fp.write(d1, scale=False).flush()
+        assert fp.nframes == d1.size * 2
+    with ewave.open(tmp_file, "r") as fp:
+        assert_array_almost_equal(np.concatenate([d1, d1]), fp.read())
+
+
+def test18_promote_to_rf64(tmp_file, monkeypatch):
+    # lower the size limit so that the switch to RF64 happens on a small file
+    monkeypatch.setattr(ewave, "_RIFF_MAX", 1000)
+    d1 = np.random.randn(100, nchan)
+    d2 = np.random.randn(100, nchan)
+    with ewave.open(tmp_file, "w", sampling_rate=Fs, dtype="f", nchannels=nchan) as fp:
+        fp.write(d1).flush()
+    assert tmp_file.read_bytes()[:4] == b"RIFF"
+    with ewave.open(tmp_file, "r+") as fp:
+        fp.write(d2)
+    assert tmp_file.read_bytes()[:4] == b"RF64"
+    with ewave.open(tmp_file, "r") as fp:
+        assert fp.nframes == 200
+        assert fp.nchannels == nchan
+        assert_array_almost_equal(np.concatenate([d1, d2]), fp.read())
+
+
+def test18_larger_junk_not_ds64(tmp_file):
+    # only a JUNK chunk that exactly fits a ds64 chunk is used for promotion;
+    # overwriting a larger one would corrupt the chunks that follow it
+    d1 = np.random.randn(100, nchan)
+    with ewave.open(tmp_file, "w", sampling_rate=Fs, dtype="f", nchannels=nchan) as fp:
+        fp.write(d1)
+    raw = tmp_file.read_bytes()
+    assert raw[12:20] == struct.pack("<4sL", b"JUNK", 28)
+    with ewave.open(tmp_file, "r+") as fp:
+        assert fp._ds64_offset == 12
+    body = b"WAVE" + struct.pack("<4sL92x", b"JUNK", 92) + raw[48:]
+    tmp_file.write_bytes(struct.pack("<4sL", b"RIFF", len(body)) + body)
+    with ewave.open(tmp_file, "r+") as fp:
+        assert fp._ds64_offset is None
+        fp.write(d1)
+    with ewave.open(tmp_file, "r") as fp:
+        assert fp.nframes == 200
+        assert_array_almost_equal(np.concatenate([d1, d1]), fp.read())
+
+
+def test19_packed_24bit(tmp_file):
+    data = np.random.uniform(-1, 1, (1000, nchan))
+    with ewave.open(
+        tmp_file, "w", sampling_rate=Fs, dtype="i", nchannels=nchan, sampwidth=3
+    ) as fp:
+        assert fp.sampwidth == 3
+        fp.write(data)
+    assert tmp_file.stat().st_size == fp._data_offset + data.size * 3
+    with ewave.open(tmp_file, "r") as fp:
+        assert fp.sampwidth == 3
+        assert fp.dtype == np.dtype("i")
+        assert fp.nframes == data.shape[0]
+        d1 = fp.read()
+        d2 = fp.read(memmap=False)
+        assert_array_almost_equal(data, ewave.rescale(d1, "f"), decimal=6)
+        assert np.array_equal(d1, d2)
+        assert np.array_equal(d1[100:200], fp.read(100, 100))
+        assert np.array_equal(d1[100:200], fp.read(100, 100, memmap=False))
+        with pytest.raises(ewave.Error):
+            fp.read(memmap="r+")
+
+
+def test20_invalid_sampwidth(tmp_file):
+    with pytest.raises(ewave.Error):
+        ewave.open(tmp_file, "w", dtype="f", sampwidth=3)
+
+
+def test21_iter_blocks(tmp_file):
+    data = np.random.randn(1000, nchan)
+    with ewave.open(tmp_file, "w+", sampling_rate=Fs, dtype="f", nchannels=nchan) as fp:
+        fp.write(data)
+        blocks = list(fp.iter_blocks(100, overlap=30, offset=10))
+        assert [b.shape[0] for b in blocks[-2:]] == [100, 80]
+        for i, block in enumerate(blocks):
+            assert_array_almost_equal(data[10 + i * 70 :][: block.shape[0]], block)
+            assert not block.flags.writeable
+        assert np.shares_memory(blocks[0], blocks[1])
+        with pytest.raises(ValueError):
+            next(fp.iter_blocks(100, overlap=100))
+
+
+def test22_iter_blocks_rescaled(tmp_file):
+    data = np.random.uniform(-1, 1, 1000)
+    with ewave.open(tmp_file, "w+", sampling_rate=Fs, dtype="h") as fp:
+        fp.write(data)
+        expected = ewave.rescale(fp.read(), "f")
+        blocks = fp.iter_blocks(300, frames=900, dtype="f")
+        for i, block in enumerate(blocks):
+            assert block.dtype == np.dtype("f")
+            assert_array_almost_equal(expected[i * 300 : (i + 1) * 300], block)
+        assert i == 2
+
+
+def test23_walk_long_header(tmp_file, monkeypatch):
+    data = np.random.randn(100, nchan)
+    with ewave.open(tmp_file, "w", sampling_rate=Fs, dtype="f", nchannels=nchan) as fp:
+        fp.write(data)
+    with ewave.open(tmp_file, "r") as fp:
+        expected = (fp.nframes, fp.nchannels, fp.dtype, fp._data_offset)
+    # header doesn't fit in the buffer so the chunks have to be walked
+    monkeypatch.setattr(ewave, "_HEADER_PEEK", 20)
+    with ewave.open(tmp_file, "r") as fp:
+        assert (fp.nframes, fp.nchannels, fp.dtype, fp._data_offset) == expected
+        assert_array_almost_equal(data, fp.read())
+
+
+def test24_scan(tmp_path):
+    paths = []
+    for i, (dtype, nchannels) in enumerate((("h", 1), ("f", 2), ("B", 3))):
+        path = tmp_path / f"test{i}.wav"
+        with ewave.open(
+            path, "w", sampling_rate=Fs + i, dtype=dtype, nchannels=nchannels
+        ) as fp:
+            fp.write(np.zeros((100 * (i + 1), nchannels)))
+        paths.append(path)
+    records = ewave.scan(paths, workers=2)
+    assert records.dtype == ewave.scan_dtype
+    for path, record in zip(paths, records, strict=True):
+        with ewave.open(path, "r") as fp:
+            assert record["nframes"] == fp.nframes
+            assert record["sampling_rate"] == fp.sampling_rate
+            assert record["nchannels"] == fp.nchannels
+            assert np.dtype(record["dtype"]) == fp.dtype
+    with pytest.raises(ewave.Error):
+        ewave.scan([*paths, tmp_path / "missing.wav"])
+
+
+def test25_header_cache(tmp_path, monkeypatch):
+    tmp_file = tmp_path / "test.wav"
+    data = np.random.randn(100, nchan)
+    with ewave.open(tmp_file, "w", sampling_rate=Fs, dtype="f", nchannels=nchan) as fp:
+        fp.write(data)
+    with ewave.HeaderCache(tmp_path / "headers.db") as cache:
+        with ewave.open(tmp_file, "r", header_cache=cache) as fp:
+            expected = (fp.nframes, fp.sampling_rate, fp.nchannels, fp.dtype)
+        assert len(cache) == 1
+
+    def fail(*args):
+        raise AssertionError("header should not be parsed")
+
+    with ewave.HeaderCache(tmp_path / "headers.db") as cache:
+        with monkeypatch.context() as m:
+            m.setattr(ewave, "_parse_header", fail)
+            with ewave.open(tmp_file, "r", header_cache=cache) as fp:
+                assert (
+                    fp.nframes,
+                    fp.sampling_rate,
+                    fp.nchannels,
+                    fp.dtype,
+                ) == expected
+                assert_array_almost_equal(data, fp.read())
+        # modifying the file invalidates the entry
+        with ewave.open(tmp_file, "r+", header_cache=cache) as fp:
+            fp.write(data)
+        with ewave.open(tmp_file, "r", header_cache=cache) as fp:
+            assert fp.nframes == data.shape[0] * 2
+
+
+def test26_rescale_out():
+    dtypes = ("u1", "h", "i", "l", "f", "d")
+    for src in dtypes:
+        d1 = np.random.uniform(-1, 1, 1000)
+        if np.dtype(src).kind != "f":
+            d1 = ewave.rescale(d1, src)
+        for tgt in dtypes:
+            out = np.empty(d1.shape, dtype=tgt)
+            result = ewave.rescale(d1, tgt, out=out)
+            assert result is out
+            assert np.array_equal(ewave.rescale(d1, tgt), out)
+    with pytest.raises(ValueError):
+        ewave.rescale(d1, "h", out=np.empty(d1.shape, dtype="f"))
+
+
+def test27_write_blocks(tmp_file, monkeypatch):
+    # small blocks so that the data are written in several pieces
+    monkeypatch.setattr(ewave, "_BLOCKSIZE", 64)
+    data = np.random.uniform(-1, 1, (nchan, 1000)).T
+    assert not data.flags.c_contiguous
+    with ewave.open(tmp_file, "w+", sampling_rate=Fs, dtype="h", nchannels=nchan) as fp:
+        fp.write(data)
+        fp.write(data.astype("h"), scale=False)
+        assert fp.nframes == data.shape[0] * 2
+        d2 = fp.read()
+        assert np.array_equal(ewave.rescale(data, "h"), d2[: data.shape[0]])
+        assert np.array_equal(data.astype("h"), d2[data.shape[0] :])
+
+
+@pytest.mark.skipif(sys.platform == "win32", reason="memmap not supported on windows")
+def test28_preallocated(tmp_file):
+    from concurrent.futures import ThreadPoolExecutor
+
+    data = np.random.randn(1000, nchan).astype("f")
+    with ewave.open(
+        tmp_file, "w+", sampling_rate=Fs, dtype="f", nchannels=nchan, nframes=1000
+    ) as fp:
+        assert fp.nframes == 1000
+        assert tmp_file.stat().st_size == fp._data_offset + data.nbytes
+        # header already has the final size
+        with ewave.open(tmp_file, "r") as rfp:
+            assert rfp.nframes == 1000
+        view = fp.read(memmap="r+")
+
+        def fill(start):
+            view[start : start + 100] = data[start : start + 100]
+
+        with ThreadPoolExecutor(4) as pool:
+            list(pool.map(fill, range(0, 1000, 100)))
+        fp.flush()
+    with ewave.open(tmp_file, "r") as fp:
+        assert fp.nframes == 1000
+        assert_array_almost_equal(data, fp.read())
+
+
+def test29_preallocated_write(tmp_file):
+    data = np.random.randn(1000, nchan)
+    with ewave.open(
+        tmp_file, "w", sampling_rate=Fs, dtype="h", nchannels=nchan, nframes=1000
+    ) as fp:
+        fp.write(data[:600]).flush()
+        fp.write(data[600:])
+        assert fp.nframes == 1000
+    with ewave.open(tmp_file, "r") as fp:
+        assert fp.nframes == 1000
+        assert np.array_equal(ewave.rescale(data, "h"), fp.read())
+
+
+@pytest.mark.skipif(sys.platform == "win32", reason="memmap not supported on windows")
+def test30_shared_mapping(tmp_file):
+    d1 = np.random.randn(100, nchan)
+    with ewave.open(tmp_file, "w+", sampling_rate=Fs, dtype="f", nchannels=nchan) as fp:
+        fp.write(d1)
+        r1 = fp.read(50, 10, memmap="r")
+        r2 = fp.read(memmap="r")
+        assert r1._mmap is r2._mmap
+        assert not r1.flags.writeable
+        assert_array_almost_equal(d1[10:60], r1)
+        # mapping is replaced when the file grows
+        fp.write(d1)
+        r3 = fp.read(memmap="r")
+        assert r3.shape[0] == 200
+        assert_array_almost_equal(np.concatenate([d1, d1]), r3)
+        # writes through the shared mapping are visible to other views
+        w = fp.read(10, memmap="r+")
+        w[:] = 0
+        assert (fp.read(10, memmap="r") == 0).all()
+
+
+def test30_concurrent_mapping(tmp_file, monkeypatch):
+    import threading
+    import time
+    from concurrent.futures import ThreadPoolExecutor
+
+    # slow down np.memmap so that racing threads would all create mappings
+    calls = []
+    memmap = np.memmap
+
+    def slow_memmap(*args, **kwargs):
+        calls.append(threading.current_thread())
+        time.sleep(0.01)
+        return memmap(*args, **kwargs)
+
+    d1 = np.random.randn(100, nchan)
+    with ewave.open(tmp_file, "w+", sampling_rate=Fs, dtype="f", nchannels=nchan) as fp:
+        fp.write(d1)
+        monkeypatch.setattr(np, "memmap", slow_memmap)
+        with ThreadPoolExecutor(8) as executor:
+            views = list(executor.map(lambda _: fp.read(memmap="r"), range(8)))
+        monkeypatch.undo()
+        assert len(calls) == 1
+        assert all(view._mmap is views[0]._mmap for view in views)
+        # the write position wasn't moved
+        fp.write(d1)
+    with ewave.open(tmp_file) as fp:
+        assert_array_almost_equal(np.concatenate([d1, d1]), fp.read())
+
+
+def test31_mapping_pool(tmp_path, monkeypatch):
+    from concurrent.futures import ThreadPoolExecutor
+
+    paths = []
+    for i in range(4):
+        path = tmp_path / f"test{i}.wav"
+        with ewave.open(path, "w", sampling_rate=Fs, dtype="h") as fp:
+            fp.write(np.full(100, i, dtype="h"), scale=False)
+        paths.append(path)
+    with ewave.MappingPool(maxfiles=2) as pool:
+        views = [pool.read(path, 10, 5) for path in paths]
+        assert len(pool) == 2
+        assert paths[0] not in pool
+        assert paths[3] in pool
+        for i, view in enumerate(views):
+            assert view.shape == (10,)
+            assert (view == i).all()
+        # using a file moves it to the end of the queue
+        pool.read(paths[2])
+        pool.read(paths[0])
+        assert paths[2] in pool
+        assert paths[3] not in pool
+    assert len(pool) == 0
+    # the pool can be used from several threads at once
+    with ewave.MappingPool(maxfiles=2) as pool, ThreadPoolExecutor(8) as executor:
+        views = list(executor.map(lambda i: pool.read(paths[i % 4], 10), range(200)))
+        assert len(pool) == 2
+    assert all((view == i % 4).all() for i, view in enumerate(views))
+    monkeypatch.setattr(ewave.MappingPool, "_shared", None)
+    with ThreadPoolExecutor(8) as executor:
+        pools = list(executor.map(lambda _: ewave.MappingPool.shared(), range(8)))
+    assert all(pool is pools[0] for pool in pools)
+
+
+def test32_async_writer(tmp_file, monkeypatch):
+    data = np.random.uniform(-1, 1, (10000, nchan))
+    with ewave.open(tmp_file, "w", sampling_rate=Fs, dtype="h", nchannels=nchan) as fp:
+        with ewave.AsyncWriter(fp, blocksize=256, nblocks=4, dtype="f") as writer:
+            for i in range(0, data.shape[0], 1000):
+                writer.write(data[i : i + 1000])
+        stats = writer.stats
+        assert stats["frames_written"] == data.shape[0]
+        assert stats["frames_dropped"] == 0
+        assert stats["queue_depth"] == 0
+        assert stats["max_enqueue_latency"] > 0
+        assert fp.nframes == data.shape[0]
+    with ewave.open(tmp_file, "r") as fp:
+        expected = ewave.rescale(ewave.rescale(data, "f"), "h")
+        assert np.array_equal(expected, fp.read())
+    # by default the conversion to the file's type is done by the writer thread
+    import threading
+
+    threads = set()
+    rescaler = ewave._rescaler
+
+    def record(src, tgt):
+        if tgt.kind == "i":
+            threads.add(threading.current_thread())
+        return rescaler(src, tgt)
+
+    monkeypatch.setattr(ewave, "_rescaler", record)
+    with ewave.open(tmp_file, "w", sampling_rate=Fs, dtype="h", nchannels=nchan) as fp:
+        with ewave.AsyncWriter(fp, blocksize=256) as writer:
+            assert writer.dtype == np.dtype("f")
+            writer.write(data)
+        assert threads == {writer._thread}
+    monkeypatch.undo()
+    with ewave.open(tmp_file, "r") as fp:
+        assert np.array_equal(expected, fp.read())
+    with pytest.raises(ValueError):
+        ewave.AsyncWriter(fp, overflow="wait")
+
+
+def test33_async_writer_overflow(tmp_file):
+    data = np.zeros(1000, dtype="h")
+    with ewave.open(tmp_file, "w", sampling_rate=Fs, dtype="h") as fp:
+        with ewave.AsyncWriter(fp, blocksize=10, nblocks=2, overflow="grow") as writer:
+            writer.write(data)
+        stats = writer.stats
+        assert stats["frames_written"] + stats["frames_dropped"] == data.size
+        assert stats["frames_dropped"] == 0
+        assert fp.nframes == data.size
+        with ewave.AsyncWriter(fp, blocksize=10, nblocks=2, overflow="drop") as writer:
+            writer.write(data)
+        stats = writer.stats
+        assert stats["frames_written"] + stats["frames_dropped"] == data.size
+
+
+def header_nframes(path):
+    """Returns number of frames according to the header on disk"""
+    with ewave.open(path, "r") as fp:
+        return fp.nframes
+
+
+def test34_header_update_policy(tmp_file):
+    data = np.zeros((100, nchan), dtype="h")
+    for policy, expected in (
+        ("flush", (0, 100, 200)),
+        ("every_write", (100, 100, 200)),
+        ("bytes=600", (0, 0, 200)),
+        ("on_close", (0, 0, 0)),
+    ):
+        with ewave.open(
+            tmp_file, "w", dtype="h", nchannels=nchan, header_update=policy
+        ) as fp:
+            fp.write(data)
+            after_write = header_nframes(tmp_file)
+            fp.flush()
+            after_flush = header_nframes(tmp_file)
+            fp.write(data)
+            fp.flush()
+            assert (after_write, after_flush, header_nframes(tmp_file)) == expected
+        assert header_nframes(tmp_file) == 200
+    with pytest.raises(ValueError):
+        ewave.open(tmp_file, "w", header_update="interval")
+
+
+def test35_repair(tmp_file):
+    data = np.random.randn(100, nchan)
+    with ewave.open(tmp_file, "w", sampling_rate=Fs, dtype="f", nchannels=nchan) as fp:
+        fp.write(data)
+    # simulate a crash by zeroing the sizes and leaving a partial frame
+    with open(tmp_file, "r+b") as fp:
+        fp.seek(4)
+        fp.write(b"\x00" * 4)
+        fp.seek(-4, 2)
+        fp.truncate()
+    assert header_nframes(tmp_file) == 100
+    assert ewave.repair(tmp_file) == 99
+    with ewave.open(tmp_file, "r") as fp:
+        assert fp.nframes == 99
+        assert_array_almost_equal(data[:99], fp.read())
+    # a complete file with metadata after the data chunk is left alone
+    with ewave.open(tmp_file, "w", sampling_rate=Fs, dtype="h", nchannels=nchan) as fp:
+        fp.write(data)
+    append_list_chunk(tmp_file)
+    contents = tmp_file.read_bytes()
+    assert ewave.repair(tmp_file) == 100
+    assert tmp_file.read_bytes() == contents
+
+
+def append_list_chunk(path):
+    """Appends a LIST chunk to a WAVE file and updates the RIFF size"""
+    chunk = struct.pack("<4sL4s4sL5s", b"LIST", 17, b"INFO", b"INAM", 5, b"test")
+    with open(path, "r+b") as fp:
+        fp.seek(0, 2)
+        fp.write(chunk + b"\x00")
+        size = fp.tell() - 8
+        fp.seek(4)
+        fp.write(struct.pack("<L", size))
+
+
+def test36_follow(tmp_file):
+    data = np.arange(1000, dtype="h")
+    with ewave.open(tmp_file, "w", dtype="h", header_update="on_close") as wfp:
+        wfp.flush()
+        with ewave.open(tmp_file, "r") as rfp:
+            blocks = rfp.follow(poll_interval=0.001, blocksize=100, timeout=0.05)
+            wfp.write(data[:250], scale=False).flush()
+            assert np.array_equal(next(blocks), data[:100])
+            assert np.array_equal(next(blocks), data[100:200])
+            wfp.write(data[250:], scale=False).flush()
+            rest = np.concatenate(list(blocks))
+            assert np.array_equal(rest, data[200:])
+    # metadata after the data chunk of a finished file aren't data
+    append_list_chunk(tmp_file)
+    with ewave.open(tmp_file, "r") as rfp:
+        blocks = list(rfp.follow(poll_interval=0.001, timeout=0.01))
+        assert np.array_equal(np.concatenate(blocks), data)
+
+
+def test37_afollow(tmp_file):
+    import asyncio
+
+    data = np.arange(1000, dtype="h")
+
+    async def collect(rfp):
+        return [block async for block in rfp.afollow(0.001, timeout=0.05)]
+
+    with ewave.open(tmp_file, "w", dtype="h", header_update="on_close") as wfp:
+        wfp.write(data, scale=False).flush()
+        with ewave.open(tmp_file, "r") as rfp:
+            assert rfp.nframes == 0
+            blocks = asyncio.run(collect(rfp))
+            assert np.array_equal(np.concatenate(blocks), data)
+
+
+def test38_read_from_buffers(tmp_file):
+    import io
+    import mmap
+
+    src_data = np.random.randn(1000, nchan)
+    with ewave.open(tmp_file, "w", sampling_rate=Fs, dtype="f", nchannels=nchan) as fp:
+        fp.write(src_data)
+    contents = tmp_file.read_bytes()
+    with tmp_file.open("rb") as f:
+        mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    for buf in (contents, bytearray(contents), memoryview(contents), mapped):
+        with ewave.open(buf) as fp:
+            assert fp.mode == "r"
+            assert fp.sampling_rate == Fs
+            for memmap in ("c", False):
+                dst_data = fp.read(memmap=memmap)
+                assert not dst_data.flags.writeable
+                assert np.shares_memory(dst_data, np.frombuffer(buf, dtype="B"))
+                assert_array_almost_equal(src_data, dst_data)
+    del dst_data
+    mapped.close()
+    bio = io.BytesIO(contents)
+    with ewave.open(bio) as fp:
+        dst_data = fp.read(100, 10)
+        assert np.shares_memory(dst_data, np.frombuffer(bio.getbuffer(), dtype="B"))
+        assert_array_almost_equal(src_data[10:110], dst_data)
+    # writing to a BytesIO still works
+    bio = io.BytesIO()
+    with ewave.open(bio, "w", dtype="h") as fp:
+        fp.write(np.arange(10, dtype="h"), scale=False).flush()
+        assert fp.filename is None
+        with ewave.open(bio.getvalue()) as rfp:
+            assert np.array_equal(rfp.read(), np.arange(10))
+
+
+def test39_open_archive_member(tmp_path):
+    import tarfile
+    from zipfile import ZIP_DEFLATED, ZIP_STORED, ZipFile
+
+    wav_name = "data/test.wav"
+    tmp_file = tmp_path / "test.wav"
+    src_data = np.random.randn(1000, nchan)
+    with ewave.open(tmp_file, "w", sampling_rate=Fs, dtype="f", nchannels=nchan) as fp:
+        fp.write(src_data)
+    for compression in (ZIP_STORED, ZIP_DEFLATED):
+        tmp_zip = tmp_path / f"test{compression}.zip"
+        with ZipFile(tmp_zip, "w", compression=compression) as archive:
+            archive.writestr("other.txt", "padding")
+            archive.write(tmp_file, arcname=wav_name)
+        with ewave.open_member(tmp_zip, wav_name) as fp:
+            assert fp.nchannels == nchan
+            dst_data = fp.read()
+            assert isinstance(dst_data, np.memmap) == (compression == ZIP_STORED)
+            assert_array_almost_equal(src_data, dst_data)
+            assert_array_almost_equal(src_data[5:10], fp.read(5, 5, memmap=False))
+    for mode in ("w", "w:gz"):
+        tmp_tar = tmp_path / "test.tar"
+        with tarfile.open(tmp_tar, mode) as archive:
+            archive.add(tmp_file, arcname=wav_name)
+        with ewave.open_member(tmp_tar, wav_name) as fp:
+            dst_data = fp.read(memmap="r")
+            assert isinstance(dst_data, np.memmap) == (mode == "w")
+            assert_array_almost_equal(src_data, dst_data)
+
+
+def test40_write_after_memmap(tmp_file):
+    # mapping the file shouldn't move the position used by write()
+    data = np.arange(10, dtype="h")
+    with ewave.open(tmp_file, "w+", dtype="h", nframes=10) as fp:
+        fp.write(data[:5], scale=False)
+        fp.read(memmap="c")
+        fp.write(data[5:], scale=False)
+    with ewave.open(tmp_file) as fp:
+        assert np.array_equal(fp.read(), data)
+
+
+def test41_read_many(tmp_path):
+    paths = [tmp_path / f"test{i}.wav" for i in range(5)]
+    data = [np.random.randn(100 + 10 * i, nchan) for i in range(len(paths))]
+    for path, d in zip(paths, data, strict=True):
+        with ewave.open(path, "w", sampling_rate=Fs, dtype="h", nchannels=nchan) as fp:
+            fp.write(d)
+    expected = [ewave.rescale(ewave.rescale(d, "h"), "f") for d in data]
+    out = ewave.read_many(paths, workers=2, fill=-1)
+    assert out.shape == (5, 140, nchan)
+    assert out.dtype == np.float32
+    for i, d in enumerate(expected):
+        assert_array_almost_equal(out[i, : d.shape[0]], d)
+        assert (out[i, d.shape[0] :] == -1).all()
+    out = ewave.read_many(paths, ragged="crop", offsets=[0, 40, 40, 60, 80])
+    assert out.shape == (5, 60, nchan)
+    assert_array_almost_equal(out[3], expected[3][60:120])
+    with pytest.raises(ewave.Error):
+        ewave.read_many(paths, ragged="error")
+    shared = np.zeros((5, 50, nchan), dtype="d")
+    assert ewave.read_many(paths, frames=10, out=shared) is shared
+    assert_array_almost_equal(shared[2], expected[2][:50])
+    # files are decoded into the rows without copying them first
+    import tracemalloc
+
+    shared = np.zeros((5, 100_000, nchan), dtype="h")
+    with ewave.open(paths[0], "w", sampling_rate=Fs, dtype="h", nchannels=nchan) as fp:
+        fp.write(np.zeros(shared.shape[1:]))
+    tracemalloc.start()
+    try:
+        ewave.read_many(paths[:1], out=shared[:1])
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    assert peak < shared[0].nbytes / 4
+    mono = np.random.uniform(-1, 1, 100)
+    with ewave.open(paths[0], "w", nchannels=1) as fp:
+        fp.write(mono)
+    with pytest.raises(ewave.Error):
+        ewave.read_many(paths, frames=10, out=shared)
+    # single-channel files can be read into an output with a channel axis
+    out = ewave.read_many(paths[:1], out=np.zeros((1, 100, 1)))
+    assert_array_almost_equal(out[0, :, 0], mono, decimal=4)
+
+
+def test42_corpus(tmp_path):
+    paths = [tmp_path / f"test{i}.wav" for i in range(4)]
+    data = [np.random.randn(n, nchan).astype("f") for n in (100, 0, 50, 200)]
+    for path, d in zip(paths, data, strict=True):
+        with ewave.open(path, "w", sampling_rate=Fs, dtype="f", nchannels=nchan) as fp:
+            fp.write(d)
+    signal = np.concatenate(data)
+    with ewave.Corpus(paths, pool=ewave.MappingPool(maxfiles=1)) as corpus:
+        assert len(corpus) == signal.shape[0]
+        assert corpus.sampling_rate == Fs
+        assert corpus.nchannels == nchan
+        assert np.array_equal(corpus[:], signal)
+        assert np.array_equal(corpus[90:160], signal[90:160])
+        assert np.array_equal(corpus[-10:5:-7], signal[-10:5:-7])
+        # strided slices only touch the files and frames they select
+        calls = []
+        read_raw = corpus._read_raw
+        corpus._read_raw = lambda *args: calls.append(args[1]) or read_raw(*args)
+        assert np.array_equal(corpus[0:350:100], signal[0:350:100])
+        assert calls == [1, 1, 101]
+        del corpus._read_raw
+        assert np.array_equal(corpus[120], signal[120])
+        assert corpus[20:30].base is not None
+        index, local = corpus.locate([0, 99, 100, 149, 150, 349])
+        assert index.tolist() == [0, 0, 2, 2, 3, 3]
+        assert local.tolist() == [0, 99, 0, 49, 0, 199]
+        with pytest.raises(IndexError):
+            corpus.locate(350)
+        corpus.save(tmp_path / "index.npz")
+    with ewave.Corpus.load(tmp_path / "index.npz", dtype="h") as corpus:
+        assert corpus.dtype == np.dtype("h")
+        assert np.array_equal(corpus[90:140], ewave.rescale(signal[90:140], "h"))
+        assert np.array_equal(corpus[140:90:-9], ewave.rescale(signal[140:90:-9], "h"))
+        # the files are only checked when they're read
+        with ewave.open(
+            paths[3], "w", sampling_rate=Fs, dtype="f", nchannels=nchan
+        ) as fp:
+            fp.write(data[3][:100])
+        with pytest.raises(ewave.Error):
+            corpus[300:]
+    with ewave.open(paths[1], "w", sampling_rate=Fs // 2, nchannels=nchan) as fp:
+        pass
+    with pytest.raises(ewave.Error):
+        ewave.Corpus(paths)
+
+
+def test43_as_array(tmp_file):
+    src_data = np.random.randn(1000, nchan)
+    with ewave.open(tmp_file, "w+", sampling_rate=Fs, dtype="h", nchannels=nchan) as fp:
+        fp.write(src_data)
+        expected = ewave.rescale(fp.read(), "f")
+        A = fp.as_array()
+        assert A.shape == (1000, nchan)
+        assert A.dtype == np.float32
+        assert len(A) == 1000
+        for key in (
+            np.s_[10:20],
+            np.s_[-5:],
+            np.s_[900:100:-3],
+            np.s_[5:5],
+            np.s_[..., 1],
+            np.s_[50, 0],
+            np.s_[-1],
+            np.s_[[3, 1, 999]],
+            np.s_[:, [1, 0]],
+        ):
+            assert np.array_equal(A[key], expected[key])
+        assert np.array_equal(np.asarray(A), expected)
+        assert np.array_equal(A.astype("h")[100:110], fp.read(10, 100))
+        with pytest.raises(IndexError):
+            A[1000]
+        with pytest.raises(IndexError):
+            A[0, 0, 0]
+        # shape follows the file
+        fp.write(src_data[:10])
+        assert A.shape == (1010, nchan)
+
+
+def test44_read_channels(tmp_file):
+    src_data = np.random.randint(-1000, 1000, size=(1000, 6), dtype="h")
+    with ewave.open(tmp_file, "w", sampling_rate=Fs, dtype="h", nchannels=6) as fp:
+        fp.write(src_data, scale=False)
+    with ewave.open(tmp_file, "r") as fp:
+        full = fp.read(memmap="r")
+        for channels in ([0, 2, 4], [5, 3], [1], slice(1, None, 2), 3, -1):
+            A = fp.read(100, 10, memmap="r", channels=channels)
+            assert np.array_equal(A, src_data[10:110, channels])
+            assert np.shares_memory(A, full)
+            B = fp.read(100, 10, channels=channels, layout="planar")
+            assert B.flags.c_contiguous
+            assert np.array_equal(B, src_data[10:110, channels].T)
+        A = fp.read(channels=[4, 0, 1], memmap=False)
+        assert np.array_equal(A, src_data[:, [4, 0, 1]])
+        assert np.array_equal(fp.read(layout="planar"), src_data.T)
+        with pytest.raises(IndexError):
+            fp.read(channels=[6])
+        with pytest.raises(ValueError):
+            fp.read(layout="columns")
+
+
+def test45_write_planar(tmp_file, monkeypatch):
+    monkeypatch.setattr(ewave, "_BLOCKSIZE", 64)
+    src_data = np.random.randn(1000, 3)
+    with ewave.open(tmp_file, "w+", sampling_rate=Fs, dtype="h", nchannels=3) as fp:
+        fp.write([src_data[:, 0], src_data[:, 1], src_data[:, 2]], layout="planar")
+        fp.write(src_data.T, layout="planar")
+        expected = ewave.rescale(np.concatenate([src_data, src_data]), "h")
+        assert np.array_equal(fp.read(), expected)
+        with pytest.raises(ewave.Error):
+            fp.write(
+                [src_data[:, 0], src_data[:10, 1], src_data[:, 2]], layout="planar"
+            )
+        with pytest.raises(ewave.Error):
+            fp.write([src_data[:, 0]], layout="planar")
+
+
+def test46_many_channels(tmp_file):
+    src_data = np.random.randint(-1000, 1000, size=(100, 64), dtype="h")
+    with ewave.open(tmp_file, "w", sampling_rate=Fs, dtype="h", nchannels=64) as fp:
+        fp.write(src_data, scale=False)
+    with ewave.open(tmp_file, "r") as fp:
+        assert fp.nchannels == 64
+        assert np.array_equal(fp.read(channels=[10, 20]), src_data[:, [10, 20]])
+
+
+def test47_concatenate(tmp_path, monkeypatch):
+    import os
+
+    paths = [tmp_path / f"test{i}.wav" for i in range(3)]
+    data = [np.random.randn(n, nchan) for n in (100, 1, 250)]
+    for path, d in zip(paths, data, strict=True):
+        with ewave.open(path, "w", sampling_rate=Fs, dtype="h", nchannels=nchan) as fp:
+            fp.write(d)
+    expected = ewave.rescale(np.concatenate(data), "h")
+    out = tmp_path / "out.wav"
+    assert ewave.concatenate(paths, out) == 351
+    with ewave.open(out) as fp:
+        assert fp.sampling_rate == Fs
+        assert np.array_equal(fp.read(), expected)
+    # append to an existing file, converting the format
+    with ewave.open(out, "w", sampling_rate=Fs, dtype="f", nchannels=nchan) as fp:
+        fp.write(expected[:10])
+    assert ewave.concatenate(paths[:1], out, mode="r+") == 100
+    with ewave.open(out) as fp:
+        assert fp.dtype == np.dtype("f")
+        assert_array_almost_equal(
+            fp.read(),
+            ewave.rescale(np.concatenate([expected[:10], expected[:100]]), "f"),
+        )
+    # fall back to copying through userspace
+    monkeypatch.delattr(os, "copy_file_range", raising=False)
+    monkeypatch.delattr(os, "sendfile", raising=False)
+    with ewave.open(out, "w+", sampling_rate=Fs, dtype="h", nchannels=nchan) as fp:
+        ewave.concatenate(paths, fp)
+        fp.write(expected[:5])
+        assert np.array_equal(fp.read(), np.concatenate([expected, expected[:5]]))
+    with ewave.open(paths[1], "w", sampling_rate=Fs // 2, nchannels=nchan) as fp:
+        pass
+    with pytest.raises(ewave.Error):
+        ewave.concatenate(paths, out)
+
+
+def test48_extract(tmp_path):
+    src = tmp_path / "src.wav"
+    dst = tmp_path / "dst.wav"
+    src_data = (np.random.randint(-(2**23), 2**23, size=(500, nchan)) << 8).astype("i")
+    with ewave.open(
+        src, "w", sampling_rate=Fs, dtype="i", sampwidth=3, nchannels=nchan
+    ) as fp:
+        fp.write(src_data, scale=False)
+    assert ewave.extract(src, dst, 100, 50) == 50
+    with ewave.open(dst) as fp:
+        assert fp.sampwidth == 3
+        assert np.array_equal(fp.read(), src_data[100:150])
+    assert ewave.extract(src, dst, 450, 100, mode="r+") == 50
+    assert ewave.extract(src, dst, 600, mode="r+") == 0
+    with ewave.open(dst) as fp:
+        assert np.array_equal(fp.read(), src_data[np.r_[100:150, 450:500]])
+    assert ewave.extract(src, dst, dtype="h") == 500
+    with ewave.open(dst) as fp:
+        assert fp.dtype == np.dtype("h")
+        assert np.array_equal(fp.read(), ewave.rescale(src_data, "h"))
+
+
+def test49_convert(tmp_path, monkeypatch):
+    monkeypatch.setattr(ewave, "_BLOCKSIZE", 256)
+    src = tmp_path / "src.wav"
+    dst = tmp_path / "dst.wav"
+    src_data = np.random.uniform(-0.9, 0.9, size=(1000, 3))
+    with ewave.open(src, "w", sampling_rate=Fs, dtype="f", nchannels=3) as fp:
+        fp.write(src_data)
+    assert ewave.convert(src, dst, dtype="h", workers=3) == 1000
+    with ewave.open(dst) as fp:
+        assert fp.dtype == np.dtype("h")
+        assert fp.sampling_rate == Fs
+        assert np.array_equal(fp.read(), ewave.rescale(src_data.astype("f"), "h"))
+    ewave.convert(src, dst, dtype="i", sampwidth=3, nchannels_map=[2, 0])
+    with ewave.open(dst) as fp:
+        assert fp.nchannels == 2
+        assert fp.sampwidth == 3
+        expected = ewave.rescale(src_data[:, [2, 0]].astype("f"), "i") & -256
+        assert np.array_equal(fp.read(), expected)
+    ewave.convert(src, dst, nchannels_map=[1])
+    with ewave.open(dst) as fp:
+        assert fp.dtype == np.dtype("f")
+        assert_array_almost_equal(fp.read(), src_data[:, 1])
+    # a map that can't be expressed as a slice
+    ewave.convert(src, dst, nchannels_map=[0, 2, 1])
+    with ewave.open(dst) as fp:
+        assert fp.nchannels == 3
+        assert_array_almost_equal(fp.read(), src_data[:, [0, 2, 1]])
+
+
+def test50_command_line(tmp_path, capsys):
+    src = tmp_path / "src.wav"
+    dst = tmp_path / "dst.wav"
+    with ewave.open(src, "w", sampling_rate=Fs, dtype="h", nchannels=2) as fp:
+        fp.write(np.random.randn(100, 2))
+    assert ewave.main(["convert", str(src), str(dst), "-t", "f", "-c", "1,0"]) == 0
+    with ewave.open(src) as fp, ewave.open(dst) as out:
+        assert out.dtype == np.dtype("f")
+        assert np.array_equal(out.read(), ewave.rescale(fp.read()[:, ::-1], "f"))
+    with pytest.raises(SystemExit):
+        ewave.main(["convert", str(src), str(dst), "-c", "5"])
+    assert "error" in capsys.readouterr().err
+
+
+def test51_rescale_clip_limits():
+    # the largest value of 32 and 64-bit integers can't be represented as a
+    # float, so clipping to it must not round up and overflow
+    for src in ("f", "d"):
+        for tgt in ("h", "i", "l", "u1"):
+            info = np.iinfo(tgt)
+            data = np.array([[-2.0, -1.0], [0.5, 1.0], [2.0, np.inf]], dtype=src)
+            out = ewave.rescale(data, tgt)
+            assert out[0, 0] == out[0, 1] == info.min
+            assert out[2, 0] == out[2, 1] == out[1, 1] > info.max * 0.99
+            assert ewave.rescale(np.float32(0.5), tgt) == out[1, 0]
+    # uint8 data, including a non-contiguous view
+    d1 = np.arange(256, dtype="u1")
+    d2 = ewave.rescale(d1[::2], "f")
+    assert d2[0] == -1.0
+    assert np.array_equal(ewave.rescale(d2, "u1"), d1[::2])
+
+
+def test52_envelope(tmp_file, monkeypatch):
+    monkeypatch.setattr(ewave, "_BLOCKSIZE", 200)
+    src_data = np.random.randn(1000, nchan)
+    with ewave.open(tmp_file, "w", sampling_rate=Fs, dtype="h", nchannels=nchan) as fp:
+        fp.write(src_data)
+    with ewave.open(tmp_file) as fp:
+        data = ewave.rescale(fp.read(), "f")
+        env = fp.envelope(binsize=10, factor=3, workers=3)
+    assert len(env) == 6
+    assert [level.shape for level in env] == [
+        (n, nchan) for n in (100, 34, 12, 4, 2, 1)
+    ]
+    assert env.frames_per_bin(1) == 30
+    assert np.array_equal(env[0]["min"], data.reshape(100, 10, nchan).min(1))
+    assert np.array_equal(env[0]["max"], data.reshape(100, 10, nchan).max(1))
+    assert np.array_equal(env[-1]["min"], data.min(0, keepdims=True))
+    # the last bin of a level can be partial
+    rms = np.sqrt(np.mean(data[990:].astype("d") ** 2, 0))
+    assert_array_almost_equal(env[0]["rms"][-1], rms)
+    rms = np.sqrt(np.mean(data[810:].astype("d") ** 2, 0))
+    assert_array_almost_equal(env[3]["rms"][-1], rms)
+    bins, size = env.select(20, offset=100, frames=800)
+    assert size == 30
+    assert bins.shape == (27, nchan)
+    assert np.array_equal(bins["max"][0], data[90:120].max(0))
+    # cached in a sidecar
+    peaks = ewave.build_peaks(tmp_file, binsize=10, factor=3)
+    sidecar = tmp_file.parent / (tmp_file.name + ".peaks.npz")
+    mtime = sidecar.stat().st_mtime_ns
+    assert np.array_equal(peaks[2], env[2])
+    monkeypatch.setattr(ewave.wavfile, "envelope", None)
+    cached = ewave.build_peaks(tmp_file, binsize=10, factor=3)
+    assert np.array_equal(cached[4], env[4])
+    assert sidecar.stat().st_mtime_ns == mtime
+    monkeypatch.undo()
+    with ewave.open(tmp_file, "r+") as fp:
+        fp.write(src_data[:10])
+    assert ewave.build_peaks(tmp_file, binsize=10, factor=3)[0].shape == (101, nchan)
+    # a corrupt sidecar is rebuilt, and one that can't be written is skipped
+    sidecar.write_bytes(sidecar.read_bytes()[:100])
+    assert ewave.build_peaks(tmp_file, binsize=10, factor=3)[0].shape == (101, nchan)
+    assert ewave.Envelope.load(sidecar)[0].shape == (101, nchan)
+    unwritable = tmp_file.parent / "missing" / "peaks.npz"
+    peaks = ewave.build_peaks(tmp_file, binsize=10, factor=3, sidecar=unwritable)
+    assert peaks[0].shape == (101, nchan)
+    assert list(tmp_file.parent.glob("*.tmp")) == []
+
+
+def test53_aopen(tmp_path):
+    import asyncio
+    import threading
+    from concurrent.futures import ThreadPoolExecutor
+
+    path = tmp_path / "test.wav"
+    src_data = np.random.randn(1000, nchan)
+
+    async def main():
+        async with await ewave.aopen(
+            path, "w+", sampling_rate=Fs, dtype="h", nchannels=nchan
+        ) as fp:
+            await asyncio.gather(fp.write(src_data[:500]), fp.write(src_data[500:]))
+            assert fp.nframes == 1000
+            expected = ewave.rescale(src_data, "h")
+            assert np.array_equal(await fp.read(10, 20), expected[20:30])
+        executor = ThreadPoolExecutor(1)
+        files = await asyncio.gather(
+            *(ewave.aopen(path, executor=executor) for _ in range(5))
+        )
+        assert all(f.fp is files[0].fp for f in files)
+        assert files[0].sampling_rate == Fs
+        # keep the pool busy until all the reads have been requested
+        busy = threading.Event()
+        executor.submit(busy.wait)
+        reads = asyncio.gather(*(f.read(100, 200) for f in files))
+        await asyncio.sleep(0.01)
+        busy.set()
+        reads = await reads
+        assert np.array_equal(reads[0], expected[200:300])
+        assert not reads[0].flags.writeable
+        # reads of the same range are coalesced
+        assert all(A is reads[0] for A in reads)
+        assert np.array_equal(await files[1].read(channels=1), expected[:, 1])
+        blocks = [b async for b in files[2].iter_blocks(300, overlap=100)]
+        assert len(blocks) == 5
+        assert np.array_equal(blocks[1], expected[200:500])
+        fp = files[0].fp
+        for f in files[:-1]:
+            await f.close()
+        assert hasattr(fp, "fp")
+        await files[-1].close()
+        assert not hasattr(fp, "fp")
+        with pytest.raises(ewave.Error):
+            await files[-1].read()
+        with pytest.raises(FileNotFoundError):
+            await ewave.aopen(tmp_path / "missing.wav")
+        executor.shutdown()
+
+    asyncio.run(main())
+
+
+def test54_tracer(tmp_file):
+    events = []
+    assert ewave.set_tracer(lambda *args: events.append(args)) is None
+    try:
+        with ewave.open(tmp_file, "w+", sampling_rate=Fs, dtype="h", nchannels=2) as fp:
+            fp.write(np.random.randn(100, 2))
+            fp.read(memmap="c")
+            ewave.rescale(fp.read(10), "f")
+    finally:
+        ewave.set_tracer(None)
+    ops = [op for op, *_ in events]
+    assert ops == [
+        "open",
+        "rescale:float64->int16",
+        "write",
+        "map",
+        "read",
+        "map",
+        "read",
+        "rescale:int16->float32",
+        "flush",
+    ]
+    assert events[2][1] == 400
+    assert events[6][1] == 40
+    assert all(seconds >= 0 for *_, seconds in events)
+    # nothing is recorded once the tracer is removed
+    with ewave.open(tmp_file) as fp:
+        fp.read()
+    assert len(events) == 9
+
+    stats = ewave.Stats()
+    ewave.set_tracer(stats)
+    try:
+        for _ in range(3):
+            with ewave.open(tmp_file) as fp:
+                fp.read(memmap="r")
+    finally:
+        ewave.set_tracer(None)
+    totals = stats.as_dict()
+    assert totals["open"]["count"] == totals["header"]["count"] == 3
+    assert totals["read"]["bytes"] == 1200
+    text = stats.to_prometheus()
+    assert 'ewave_operations_total{op="read"} 3' in text
+    assert 'ewave_bytes_total{op="read"} 1200' in text
+    stats.reset()
+    assert stats.as_dict() == {}
+    # reads from the shared mapping, at an offset
+    ewave.set_tracer(stats)
+    try:
+        with ewave.open(tmp_file) as fp:
+            fp.read(10, 50, memmap="r")
+    finally:
+        ewave.set_tracer(None)
+    totals = stats.as_dict()
+    assert totals["read"]["bytes"] == 40
+    assert 0 <= totals["read"]["seconds"] < 1
+
+
+def test55_benchmarks(tmp_path, capsys):
+    import json
+
+    import bench_ewave
+
+    assert bench_ewave.parse_size("64M") == 64 << 20
+    baseline = tmp_path / "baseline.json"
+    args = ["--sizes", "1K", "--formats", "i2,i3", "--channels", "2"]
+    args += ["--repeat", "1", "--min-time", "0", "--dir", str(tmp_path)]
+    assert bench_ewave.main([*args, "--save", str(baseline)]) == 0
+    with open(baseline) as fp:
+        results = json.load(fp)["results"]
+    assert len(results) == 22
+    # every storable type is used as a source for writes
+    assert {"write_B[i2x2,1K]", "write_l[i3x2,1K]"} <= results.keys()
+    assert results["read_memmap[i3x2,1K]"]["bytes"] > 1024
+    for result in results.values():
+        result["seconds"] /= 100
+    with open(baseline, "w") as fp:
+        json.dump({"results": results}, fp)
+    assert bench_ewave.main([*args, "--only", "open", "--compare", str(baseline)]) == 1
+    assert "REGRESSION open[i2x2,1K]" in capsys.readouterr().out
+
+
+def test56_summary(tmp_path, monkeypatch):
+    monkeypatch.setattr(ewave, "_BLOCKSIZE", 300)
+    path = tmp_path / "test.wav"
+    src_data = np.random.uniform(-0.5, 0.5, size=(1000, 3))
+    src_data += [0, 0.2, -0.1]
+    src_data[10, 1] = 1.5
+    for dtype, sampwidth in (("h", None), ("i", 3), ("l", None), ("B", None)):
+        with ewave.open(path, "w", dtype=dtype, sampwidth=sampwidth, nchannels=3) as fp:
+            fp.write(src_data)
+        with ewave.open(path) as fp:
+            data = ewave.rescale(fp.read(), "d")
+            stats = fp.summary(workers=3)
+            assert stats.dtype == ewave.summary_dtype
+            assert stats.shape == (3,)
+            assert_array_almost_equal(stats["min"], data.min(0))
+            assert_array_almost_equal(stats["max"], data.max(0))
+            assert_array_almost_equal(stats["peak"], np.abs(data).max(0))
+            assert_array_almost_equal(stats["dc"], data.mean(0))
+            assert_array_almost_equal(stats["rms"], np.sqrt((data**2).mean(0)))
+            assert stats["clipped"].tolist() == [0, 1, 0]
+            assert stats["nan"].tolist() == [0, 0, 0]
+            # sums of selected channels may be rounded differently
+            selected = fp.summary(channels=[2, 0])
+            assert_array_almost_equal(selected[0].tolist(), stats[2].tolist())
+            assert_array_almost_equal(
+                fp.summary(channels=1).tolist(), stats[1].tolist()
+            )
+    src_data[20:25, 0] = np.nan
+    with ewave.open(path, "w", dtype="f", nchannels=3) as fp:
+        fp.write(src_data)
+    with ewave.open(path) as fp:
+        stats = fp.summary()
+    valid = src_data[~np.isnan(src_data[:, 0]), 0]
+    assert stats["nan"].tolist() == [5, 0, 0]
+    assert stats["clipped"].tolist() == [0, 1, 0]
+    assert_array_almost_equal(stats["dc"][0], valid.mean())
+    assert_array_almost_equal(stats["min"][0], valid.min())
+    # cached in a sidecar
+    assert np.array_equal(ewave.summarize(path), stats)
+    monkeypatch.setattr(ewave.wavfile, "summary", None)
+    assert np.array_equal(ewave.summarize(path, channels=[1, 2]), stats[1:])
+    monkeypatch.undo()
+    with ewave.open(path, "w", dtype="f", nchannels=3) as fp:
+        pass
+    assert np.isnan(ewave.summarize(path)["rms"]).all()
+    sidecar = tmp_path / "test.wav.summary.npz"
+    sidecar.write_bytes(b"PK\x03\x04 not really a zip file")
+    assert np.isnan(ewave.summarize(path)["rms"]).all()
+    assert np.isnan(
+        ewave.summarize(path, sidecar=tmp_path / "x" / "y.npz")["rms"]
+    ).all()
+
+
+def test57_read_out(tmp_file):
+    src_data = np.random.randint(-(2**15), 2**15, size=(1000, 3), dtype="h")
+    with ewave.open(tmp_file, "w", sampling_rate=Fs, dtype="h", nchannels=3) as fp:
+        fp.write(src_data, scale=False)
+    with ewave.open(tmp_file) as fp:
+        buf = np.zeros((100, 3), dtype="h")
+        A = fp.read(offset=50, out=buf)
+        assert A is buf or A.base is buf
+        assert np.array_equal(buf, src_data[50:150])
+        # the part of out that was filled
+        A = fp.read(offset=950, out=buf)
+        assert A.shape == (50, 3)
+        assert np.array_equal(buf[:50], src_data[950:])
+        expected = ewave.rescale(src_data, "f")
+        assert_array_almost_equal(fp.read(20, 10, dtype="f"), expected[10:30])
+        buf = np.zeros((2, 100), dtype="f")
+        fp.read(offset=5, channels=[2, 0], layout="planar", out=buf)
+        assert np.array_equal(buf, expected[5:105, [2, 0]].T)
+        buf = np.zeros(100, dtype="d")
+        fp.read(offset=5, channels=1, out=buf)
+        assert np.array_equal(buf, ewave.rescale(src_data[5:105, 1], "d"))
+        with pytest.raises(ValueError):
+            fp.read(10, out=np.zeros((20, 3), dtype="h"))
+        with pytest.raises(ValueError):
+            fp.read(out=np.zeros((20, 3), dtype="h"), dtype="f")
+    src_data = (np.random.randint(-(2**23), 2**23, size=(100, 2)) << 8).astype("i")
+    with ewave.open(tmp_file, "w", dtype="i", sampwidth=3, nchannels=2) as fp:
+        fp.write(src_data, scale=False)
+    with ewave.open(tmp_file) as fp:
+        buf = np.zeros((60, 2), dtype="i")
+        fp.read(offset=40, out=buf)
+        assert np.array_equal(buf, src_data[40:])
+    with open(tmp_file, "r+b") as fp:
+        fp.truncate(tmp_file.stat().st_size - 30)
+    with ewave.open(tmp_file) as fp:
+        with pytest.raises(ewave.Error):
+            fp.read(offset=40, out=buf)
+
+
+def test58_shared_memory(tmp_file):
+    import pickle
+
+    src_data = np.random.randn(1000, nchan)
+    with ewave.open(tmp_file, "w", sampling_rate=Fs, dtype="h", nchannels=nchan) as fp:
+        fp.write(src_data)
+    with ewave.open(tmp_file) as fp:
+        expected = ewave.rescale(fp.read(), "f")
+        shared = fp.share(dtype="f")
+    try:
+        assert shared.data.shape == (1000, nchan)
+        assert shared.sampling_rate == Fs
+        assert np.array_equal(shared.data, expected)
+        # workers receive the object by pickling, which attaches to the block
+        with pickle.loads(pickle.dumps(shared)) as other:
+            assert other.name == shared.name
+            assert np.array_equal(other.data, expected)
+            other.data[0, 0] = 0.5
+        assert shared.data[0, 0] == 0.5
+    finally:
+        shared.close()
+        shared.unlink()
+
+
 # Variables:
 # End: